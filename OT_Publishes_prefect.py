@@ -1,204 +1,2720 @@
 # Standard library imports
+import asyncio
 import datetime
+import glob
+import hashlib
+import json
+import multiprocessing
 import os
+import shutil
+import statistics
 import sys
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 
 # Third-party imports
+import aiohttp
 import duckdb
 from dotenv import load_dotenv
 import polars as pl
+import pyarrow as pa
 import requests
 from prefect import flow, task
+from prefect.runtime import flow_run
 from prefect.task_runners import ConcurrentTaskRunner
 from web3 import Web3
+from web3.providers.base import JSONBaseProvider
 
+# ServiceAgreementV1 contract
+# Endpoints can be overridden from the environment, e.g. to run against benchmarks/chain_simulator.py
+ONFINALITY_RPC_URL = os.getenv("ONFINALITY_RPC_URL", 'https://origintrail.api.onfinality.io/rpc')
+ONFINALITY_WS_URL = os.getenv("ONFINALITY_WS_URL", 'wss://origintrail.api.onfinality.io/ws')
+CONTRACT_ADDRESS = '0xB20F6F3B9176D4B284bA26b80833ff5bFe6db28F'
+# keccak('ServiceAgreementV1Created(address,uint256,bytes,uint8,uint256,uint16,uint128,uint96)')
+SERVICE_AGREEMENT_V1_CREATED_TOPIC = '0x4b81188c3c973dd634ec0dae5b7e72f92bb03834c830739d63935923950d6f64'
+# The rest of the agreement lifecycle, read in the same eth_getLogs scan: topic0 -> (event, table, value argument)
+SERVICE_AGREEMENT_LIFECYCLE_EVENTS = {
+    # keccak('ServiceAgreementV1Extended(bytes32,uint16)')
+    '0xd3c4c2750e1e1293020095a2f42986ac9b3a4673299e4c653d411f4f23366fba':
+        ('ServiceAgreementV1Extended', 'service_agreement_extended', 'epochsNumber'),
+    # keccak('ServiceAgreementV1RewardRaised(bytes32,uint96)')
+    '0x90840e0b7ccf40ddc471c0368c567e5f17ba45b13a4d3df78e7b15777a5a9421':
+        ('ServiceAgreementV1RewardRaised', 'service_agreement_reward_raised', 'tokenAmount'),
+    # keccak('ServiceAgreementV1Terminated(bytes32)')
+    '0xa2046e95b0f3c09b590f520cc8ff057dae18eab6f5babd635cdc736093364ea3':
+        ('ServiceAgreementV1Terminated', 'service_agreement_terminated', None),
+    # keccak('ServiceAgreementV1UpdateRewardRaised(bytes32,uint96)')
+    '0x3b81258b404713da9e3591f3b422e39802a2def5d5fab04f9731ef691933c382':
+        ('ServiceAgreementV1UpdateRewardRaised', 'service_agreement_update_reward_raised', 'updateTokenAmount'),
+}
+# topic0 OR-filter for all five events
+SERVICE_AGREEMENT_TOPICS = [[SERVICE_AGREEMENT_V1_CREATED_TOPIC] + list(SERVICE_AGREEMENT_LIFECYCLE_EVENTS)]
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+SERVICE_AGREEMENT_ABI_PATH = os.path.join(DATA_DIR, 'ServiceAgreementV1.json')
+SERVICE_AGREEMENT_EVENT_NAME = 'ServiceAgreementV1Created'
+SERVICE_AGREEMENT_STREAM = f'{CONTRACT_ADDRESS}:{SERVICE_AGREEMENT_EVENT_NAME}'
 
-@task(log_prints=True, retries=3, retry_delay_seconds=5, tags=['extract-events'])
-def extract_events(con, serviceAgreementABI, ONFINALITY_KEY):
-    # Connect to the Ethereum node using Websockets
-    w3 = Web3(Web3.HTTPProvider(f'https://origintrail.api.onfinality.io/rpc?apikey={ONFINALITY_KEY}'))
+# Local DuckDB file for caches that outlive a flow run
+CACHE_DATABASE_PATH = os.path.join(DATA_DIR, 'cache.db')
+# Cache statements run one at a time: sources ingested side by side use the same file from worker threads
+CACHE_DATABASE_LOCK = threading.Lock()
+BLOCK_HEADER_CACHE_SIZE = 100_000
+TRANSACTION_CACHE_SIZE = 2_000_000
+
+# Stage outputs of a block range, kept until the range is loaded so a retried or resumed run can skip
+# finished stages. Keyed by this file's content hash, so a code change never reuses old outputs.
+STAGE_CHECKPOINT_DIR = os.path.join(DATA_DIR, 'stages')
+with open(os.path.abspath(__file__), 'rb') as source_file:
+    CODE_VERSION = hashlib.sha256(source_file.read()).hexdigest()[:12]
+
+# Parquet landing zone: every loaded batch is also written here, one file per day of TIME_OF_TRANSACTION
+# under publishes/DAY=YYYY-MM-DD/, sorted by block so row-group statistics skip whole block ranges.
+# landing.db next to it holds the publishes_landing view. An empty LANDING_DIR turns it off.
+# A day a load touches is compacted into one file once it holds LANDING_COMPACT_FILES files.
+LANDING_DIR = os.getenv("LANDING_DIR", os.path.join(DATA_DIR, 'landing'))
+LANDING_ROW_GROUP_SIZE = 100_000
+LANDING_COMPACT_FILES = int(os.getenv("LANDING_COMPACT_FILES", 8))
+
+# Polars keeps decimal columns (TRAC amounts) exact instead of converting them to Float64
+if hasattr(pl.Config, 'activate_decimals'):
+    pl.Config.activate_decimals(True)
+
+# Decoded ServiceAgreementV1Created events, one typed column per argument. tokenAmount is the uint96 wei amount
+# read at scale 18, i.e. exact TRAC; tokenId is a counter and fits a uint64.
+TRAC_DECIMAL = pa.decimal128(38, 18)
+SERVICE_AGREEMENT_EVENT_SCHEMA = pa.schema([
+    ('assetContract', pa.string()),
+    ('keyword', pa.string()),
+    ('hashFunctionId', pa.uint8()),
+    ('startTime', pa.timestamp('s')),
+    ('epochsNumber', pa.uint16()),
+    ('epochLength', pa.int64()),
+    ('tokenAmount', TRAC_DECIMAL),
+    ('event', pa.string()),
+    ('tokenId', pa.uint64()),
+    ('transactionHash', pa.string()),
+    ('blockHash', pa.string()),
+    ('blockNumber', pa.int64()),
+    ('address', pa.string())
+])
+
+# Sources ingested side by side by ot_sources_flow, each with its own cursor (stream). Every network gets its
+# own DuckDB schema and header cache file, since block numbers only mean something within one chain.
+# Adding a contract or a chain is a new entry here; api_key_env names the env var appended as ?apikey=.
+SOURCES = [
+    {
+        'network': 'origintrail',
+        'schema': 'main',
+        'rpc_url': ONFINALITY_RPC_URL,
+        'api_key_env': 'ONFINALITY_KEY',
+        'contract_address': CONTRACT_ADDRESS,
+        'topics': SERVICE_AGREEMENT_TOPICS,
+        'event_name': SERVICE_AGREEMENT_EVENT_NAME,
+        'stream': SERVICE_AGREEMENT_STREAM,
+        'header_cache_path': CACHE_DATABASE_PATH,
+    },
+    {
+        # service_agreement_v1 contract where publishing started
+        'network': 'origintrail',
+        'schema': 'main',
+        'rpc_url': ONFINALITY_RPC_URL,
+        'api_key_env': 'ONFINALITY_KEY',
+        'contract_address': '0x4B014C4B8DA1853243fBd9d404F10Db6Aa9FADFc',
+        'topics': SERVICE_AGREEMENT_TOPICS,
+        'event_name': 'ServiceAgreementV1',
+        'stream': '0x4B014C4B8DA1853243fBd9d404F10Db6Aa9FADFc:ServiceAgreementV1',
+        'header_cache_path': CACHE_DATABASE_PATH,
+    },
+]
+
+# Reorg protection: blocks newer than head - CONFIRMATION_DEPTH are left for a later run, and the hashes of
+# the last REORG_WINDOW ingested blocks are kept to find the fork point when the chain changes underneath us
+CONFIRMATION_DEPTH = 10
+REORG_WINDOW = 128
+
+# Streaming tail mode
+STREAM_CONFIRMATION_DEPTH = 0
+STREAM_POLL_SECONDS = 1
+STREAM_WS_RETRY_SECONDS = 60
+
+# RPC endpoint pool: extra endpoints come from RPC_ENDPOINTS (comma-separated URLs). Calls go to the endpoint
+# with the best rolling latency/error score, and a duplicate is sent to the next one when a call runs past
+# that endpoint's p95 latency.
+RPC_POOL_WINDOW = 200
+RPC_POOL_ERROR_PENALTY = 10
+RPC_POOL_THREADS = 16
+RPC_HEDGE_MIN_SAMPLES = 20
+RPC_HEDGE_BUDGET = 0.1
+RPC_REQUEST_TIMEOUT_SECONDS = 60
+
+# Async I/O: keep-alive connections and requests in flight per host
+ASYNC_CONNECTIONS_PER_HOST = 100
+ASYNC_REQUEST_TIMEOUT_SECONDS = 60
+
+# Transaction enrichment
+RPC_BATCH_SIZE = 200
+SUBSCAN_TRANSACTION_URL = os.getenv("SUBSCAN_TRANSACTION_URL",
+                                    "https://origintrail.api.subscan.io/api/scan/evm/transaction")
+
+# Subscan enrichment: requests/s allowed by the API key, shared by every worker in the process, and the bounds
+# of the adaptive in-flight window
+SUBSCAN_RATE_LIMIT = float(os.getenv("SUBSCAN_RATE_LIMIT", 5))
+SUBSCAN_CONCURRENCY_MIN = 1
+SUBSCAN_CONCURRENCY_MAX = 32
+SUBSCAN_MAX_ATTEMPTS = 8
+# Lookups failing for other reasons than rate limits give up sooner and go to the dead-letter table
+SUBSCAN_ERROR_ATTEMPTS = 3
+SUBSCAN_BACKOFF_SECONDS = 0.5
+SUBSCAN_REQUEST_TIMEOUT_SECONDS = 30
+# Subscan answers rate limiting with HTTP 429 and/or code 20008 (API rate limit exceeded)
+SUBSCAN_RATE_LIMIT_CODES = (20008,)
+
+# Dead-letter table of transactions whose enrichment failed, retried by ot_dead_letter_flow with backoff
+DEAD_LETTER_BACKOFF_SECONDS = 300
+DEAD_LETTER_MAX_BACKOFF_SECONDS = 86_400
+DEAD_LETTER_MAX_ATTEMPTS = 10
+DEAD_LETTER_BATCH_SIZE = 5_000
+
+# Where the transform runs: "polars" builds the publishes DataFrame in the flow, "sql" hands the raw events
+# and enrichment rows to load_to_motherduck, which produces the publishes rows in DuckDB
+TRANSFORM_MODE = os.getenv("TRANSFORM_MODE", "polars")
+
+# How batches are merged into publishes: "anti_join" appends the batch rows whose hash is not loaded yet in one
+# set-based statement; "on_conflict" is INSERT ... ON CONFLICT DO NOTHING, which handles every row through
+# the primary key; "merge" is MERGE INTO ... WHEN NOT MATCHED THEN INSERT (DuckDB 1.4 or later).
+# Compare them with benchmarks/benchmark_load.py.
+LOAD_STRATEGY = os.getenv("LOAD_STRATEGY", "anti_join")
+LOAD_STRATEGIES = ("anti_join", "on_conflict", "merge")
+
+# Layout of the publishes table: "v1" is publishes, with hex strings and floats; "v2" is publishes_v2, with
+# hashes and addresses as BLOB, integer ids and block numbers, epoch length in seconds and TRAC as an exact
+# decimal; "v3" is the publishes_v3 fact table, like v2 but with integer keys into the PUBLISHES_DIMENSIONS
+# tables instead of addresses. Copy the loaded rows with `python OT_Publishes_prefect.py migrate v2` (or v3)
+# before switching. What switching buys is exact TRAC and a file about a quarter smaller (benchmark_storage.py,
+# 500k-1M rows); full scans and hash lookups are not reliably faster, and on DuckDB 1.5 a lookup by hash is a
+# filtered scan in every layout, not a primary-key probe.
+PUBLISHES_SCHEMA = os.getenv("PUBLISHES_SCHEMA", "v1")
+PUBLISHES_TABLES = {"v1": "publishes", "v2": "publishes_v2", "v3": "publishes_v3"}
+
+# (dimension table, surrogate key, batch column) of the v3 star schema. Keys are dense integers handed out in
+# the batch that first brings an address.
+PUBLISHES_DIMENSIONS = [
+    ("asset_contracts", "CONTRACT_KEY", "ASSET_CONTRACT"),
+    ("publishers", "PUBLISHER_KEY", "PUBLISHER_ADDRESS"),
+    ("recipients", "RECIPIENT_KEY", "SENT_ADDRESS")
+]
+
+# Dashboard rollups of the publishes table, one table per (suffix, date_trunc part): publishes, TRAC sum and
+# average and distinct assets per publisher per bucket, e.g. publishes_per_hour. merge_publishes refreshes the
+# buckets a batch touches in its own transaction.
+ROLLUP_GRANULARITIES = [("per_minute", "minute"), ("per_hour", "hour"), ("per_day", "day")]
+# Per publishes table: publisher column and type, and the type of the TRAC sum
+ROLLUP_COLUMNS = {
+    "publishes": ("PUBLISHER_ADDRESS", "VARCHAR(100)", "DOUBLE"),
+    "publishes_v2": ("PUBLISHER_ADDRESS", "BLOB", "DECIMAL(38, 18)"),
+    "publishes_v3": ("PUBLISHER_KEY", "UINTEGER", "DECIMAL(38, 18)")
+}
+
+# Columns of every publishes batch: the v1 publishes columns in table order, then the asset contract,
+# which only v3 stores
+PUBLISHES_COLUMNS = ["MESSAGE",
+                     "ASSET_ID",
+                     "BLOCK_NUMBER",
+                     "TIME_ASSET_CREATED",
+                     "TIME_OF_TRANSACTION",
+                     "TRAC_PRICE",
+                     "EPOCHS_NUMBER",
+                     "EPOCH_LENGTH-(DAYS)",
+                     "PUBLISHER_ADDRESS",
+                     "SENT_ADDRESS",
+                     "TRANSACTION_HASH",
+                     "BLOCK_HASH",
+                     "ASSET_CONTRACT"]
+
+# Historical backfill
+BACKFILL_SHARD_SIZE = 50_000
+BACKFILL_PROCESSES = 4
+
+# eth_getLogs block-range chunking
+LOG_CHUNK_INITIAL = 500
+LOG_CHUNK_MIN = 1
+LOG_CHUNK_MAX = 100_000
+LOG_CHUNK_TARGET_EVENTS = 1_000
+LOG_CHUNK_PROBE_AFTER = 10
+
+# Error fragments providers use when an eth_getLogs window is too large or too slow. Not the -32005 code
+# itself: providers send it for rate limiting too, which the LOG_RATE_LIMIT_ERRORS wording tells apart.
+LOG_RANGE_ERRORS = (
+    "query returned more than",
+    "too many results",
+    "too many logs",
+    "log response size exceeded",
+    "block range",
+    "range too large",
+    "timeout",
+    "timed out",
+)
+
+# A throttled call says nothing about the range size; it propagates to the task's retry instead of halving
+LOG_RATE_LIMIT_ERRORS = (
+    "rate limit",
+    "request rate",
+    "rate exceeded",
+    "too many requests",
+    "429",
+)
+
+
+def is_log_range_error(error):
+    if isinstance(error, (requests.exceptions.Timeout, TimeoutError, asyncio.TimeoutError)):
+        return True
+    message = str(error).lower()
+    if any(fragment in message for fragment in LOG_RATE_LIMIT_ERRORS):
+        return False
+    return any(fragment in message for fragment in LOG_RANGE_ERRORS)
+
+
+class LogRangeChunker:
+    # Adaptive eth_getLogs window over from_block..to_block, shared by the sync and async log readers.
+    # The window doubles while chunks come back sparse and halves when the provider rejects or times out
+    # on a range. A rejected size becomes a ceiling that is only probed again after a run of clean chunks.
+
+    def __init__(self, from_block, to_block, chunk_size=LOG_CHUNK_INITIAL, target_events=LOG_CHUNK_TARGET_EVENTS):
+        self.start = from_block
+        self.to_block = to_block
+        self.chunk_size = chunk_size
+        self.target_events = target_events
+        self.ceiling = LOG_CHUNK_MAX
+        self.clean_chunks = 0
+
+    def next_range(self):
+        if self.start > self.to_block:
+            return None
+        return self.start, min(self.start + self.chunk_size - 1, self.to_block)
+
+    def rejected(self, start, end, error):
+        # False when the error is not about the range size and should propagate
+        if start == end or not is_log_range_error(error):
+            return False
+        self.chunk_size = max(LOG_CHUNK_MIN, (end - start + 1) // 2)
+        self.ceiling = self.chunk_size
+        self.clean_chunks = 0
+        print(f"Blocks {start}-{end} rejected by the provider, retrying with {self.chunk_size} blocks.")
+        return True
+
+    def accepted(self, end, number_of_logs):
+        self.start = end + 1
+
+        self.clean_chunks += 1
+        if self.clean_chunks >= LOG_CHUNK_PROBE_AFTER:
+            self.ceiling = min(LOG_CHUNK_MAX, self.ceiling * 2)
+            self.clean_chunks = 0
+
+        if number_of_logs < self.target_events // 2:
+            self.chunk_size = min(self.ceiling, self.chunk_size * 2)
+        elif number_of_logs > self.target_events * 2:
+            self.chunk_size = max(LOG_CHUNK_MIN, self.chunk_size // 2)
+
+
+def iter_logs_chunked(get_logs, from_block, to_block, chunk_size=LOG_CHUNK_INITIAL,
+                      target_events=LOG_CHUNK_TARGET_EVENTS):
+    # Walks from_block..to_block with get_logs(start, end). Logs are yielded as they arrive so a long
+    # backfill never holds more than one chunk in memory.
+    chunker = LogRangeChunker(from_block, to_block, chunk_size, target_events)
+    while (block_range := chunker.next_range()) is not None:
+        start, end = block_range
+        try:
+            logs = get_logs(start, end)
+        except Exception as error:
+            if not chunker.rejected(start, end, error):
+                raise
+            continue
+
+        yield from logs
+        chunker.accepted(end, len(logs))
+
+
+async def fetch_logs_chunked_async(get_logs, from_block, to_block, chunk_size=LOG_CHUNK_INITIAL,
+                                   target_events=LOG_CHUNK_TARGET_EVENTS):
+    # Same walk as iter_logs_chunked with an awaitable get_logs(start, end)
+    chunker = LogRangeChunker(from_block, to_block, chunk_size, target_events)
+    collected = []
+    while (block_range := chunker.next_range()) is not None:
+        start, end = block_range
+        try:
+            logs = await get_logs(start, end)
+        except Exception as error:
+            if not chunker.rejected(start, end, error):
+                raise
+            continue
+
+        collected.extend(logs)
+        chunker.accepted(end, len(logs))
+
+    return collected
+
+
+class RpcEndpointPool:
+    # Routes JSON-RPC payloads across endpoints by health: each endpoint keeps a rolling window of
+    # latencies and an exponentially weighted error rate. A call that outlives the chosen endpoint's p95
+    # latency gets a hedged duplicate on the next-best endpoint (at most RPC_HEDGE_BUDGET of calls), and
+    # transport errors fail over to the next endpoint. JSON-RPC error responses are returned as-is.
+
+    def __init__(self, endpoints, window=RPC_POOL_WINDOW):
+        self.endpoints = list(dict.fromkeys(endpoints))
+        self.latencies = {endpoint: deque(maxlen=window) for endpoint in self.endpoints}
+        self.error_rates = {endpoint: 0.0 for endpoint in self.endpoints}
+        self.requests = 0
+        self.hedges = 0
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=RPC_POOL_THREADS)
+
+    def record(self, endpoint, latency=None):
+        with self.lock:
+            if latency is None:
+                self.error_rates[endpoint] = 0.9 * self.error_rates[endpoint] + 0.1
+            else:
+                self.error_rates[endpoint] = 0.9 * self.error_rates[endpoint]
+                self.latencies[endpoint].append(latency)
+
+    def score(self, endpoint):
+        # Lower is better. Endpoints without measurements are tried first until they fail: failures add no
+        # latency, so an endpoint that has only ever failed ranks last instead of first.
+        latencies = self.latencies[endpoint]
+        if not latencies:
+            return 0.0 if self.error_rates[endpoint] == 0 else float('inf')
+        return statistics.median(latencies) * (1 + RPC_POOL_ERROR_PENALTY * self.error_rates[endpoint])
+
+    def plan(self):
+        # (endpoint order, hedge delay or None) for the next call
+        with self.lock:
+            ranked = sorted(self.endpoints, key=self.score)
+            latencies = sorted(self.latencies[ranked[0]])
+            self.requests += 1
+            if len(latencies) < RPC_HEDGE_MIN_SAMPLES or self.hedges >= RPC_HEDGE_BUDGET * self.requests:
+                return ranked, None
+            return ranked, latencies[int(len(latencies) * 0.95) - 1]
+
+    def hedged(self):
+        with self.lock:
+            self.hedges += 1
+
+    def post(self, endpoint, payload):
+        started = time.perf_counter()
+        try:
+            response = self.session.post(endpoint, json=payload, timeout=RPC_REQUEST_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            result = response.json()
+        except Exception:
+            self.record(endpoint)
+            raise
+        self.record(endpoint, time.perf_counter() - started)
+        return result
+
+    def request(self, payload):
+        ranked, hedge_delay = self.plan()
+        # With a single endpoint the hedge and the failover go to the same URL once more
+        backups = iter(ranked[1:] or ranked)
+
+        in_flight = {self.executor.submit(self.post, ranked[0], payload)}
+        last_error = None
+        while in_flight:
+            done, in_flight = wait(in_flight, timeout=hedge_delay, return_when=FIRST_COMPLETED)
+            if not done:
+                # Past p95: race a duplicate on the next endpoint
+                hedge_delay = None
+                backup = next(backups, None)
+                if backup is not None:
+                    self.hedged()
+                    in_flight.add(self.executor.submit(self.post, backup, payload))
+                continue
+
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as error:
+                    last_error = error
+
+            if not in_flight:
+                backup = next(backups, None)
+                if backup is not None:
+                    in_flight.add(self.executor.submit(self.post, backup, payload))
+
+        raise last_error
+
+    async def request_async(self, session, payload):
+        ranked, hedge_delay = self.plan()
+        backups = iter(ranked[1:] or ranked)
+
+        async def attempt(endpoint):
+            started = time.perf_counter()
+            try:
+                async with session.post(endpoint, json=payload) as response:
+                    response.raise_for_status()
+                    result = await response.json(content_type=None)
+            except Exception:
+                self.record(endpoint)
+                raise
+            self.record(endpoint, time.perf_counter() - started)
+            return result
+
+        in_flight = {asyncio.ensure_future(attempt(ranked[0]))}
+        last_error = None
+        try:
+            while in_flight:
+                done, in_flight = await asyncio.wait(in_flight, timeout=hedge_delay, return_when=FIRST_COMPLETED)
+                if not done:
+                    hedge_delay = None
+                    backup = next(backups, None)
+                    if backup is not None:
+                        self.hedged()
+                        in_flight.add(asyncio.ensure_future(attempt(backup)))
+                    continue
+
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+
+                if not in_flight:
+                    backup = next(backups, None)
+                    if backup is not None:
+                        in_flight.add(asyncio.ensure_future(attempt(backup)))
+        finally:
+            # The losing duplicate is no longer needed
+            for task in in_flight:
+                task.cancel()
+
+        raise last_error
+
+
+RPC_POOLS = {}
+
+
+def rpc_pool_for(rpc_url):
+    # One pool per primary endpoint, shared by the sync and async paths. Keyed by process as well, since
+    # forked backfill workers can't reuse the parent's session and threads.
+    key = (os.getpid(), rpc_url)
+    if key not in RPC_POOLS:
+        extra_endpoints = [endpoint.strip() for endpoint in os.getenv("RPC_ENDPOINTS", "").split(",")
+                           if endpoint.strip()]
+        RPC_POOLS[key] = RpcEndpointPool([rpc_url] + extra_endpoints)
+    return RPC_POOLS[key]
+
+
+class PooledRpcProvider(JSONBaseProvider):
+    # web3 provider that sends everything through the endpoint pool, so w3.eth calls get the same routing
+
+    def __init__(self, rpc_url):
+        super().__init__()
+        self.rpc_url = rpc_url
+
+    def make_request(self, method, params):
+        return rpc_pool_for(self.rpc_url).request({
+            'jsonrpc': '2.0',
+            'id': next(self.request_counter),
+            'method': method,
+            'params': params
+        })
+
+    def is_connected(self, show_traceback=False):
+        try:
+            return 'result' in self.make_request('web3_clientVersion', [])
+        except Exception:
+            if show_traceback:
+                raise
+            return False
+
+
+def onfinality_rpc_url(ONFINALITY_KEY):
+    return f'{ONFINALITY_RPC_URL}?apikey={ONFINALITY_KEY}'
+
+
+def load_service_agreement_abi():
+    with open(SERVICE_AGREEMENT_ABI_PATH, 'r') as file:
+        return json.load(file)
+
+
+def publishes_table(schema=PUBLISHES_SCHEMA):
+    if schema not in PUBLISHES_TABLES:
+        raise ValueError(f"Unknown publishes schema {schema!r}, expected one of {tuple(PUBLISHES_TABLES)}")
+    return PUBLISHES_TABLES[schema]
+
+
+def create_publishes_table(con, schema=PUBLISHES_SCHEMA):
+    if publishes_table(schema) == 'publishes_v2':
+        create_publishes_v2_table(con)
+    elif publishes_table(schema) == 'publishes_v3':
+        create_publishes_v3_tables(con)
+    else:
+        create_publishes_v1_table(con)
+    create_rollup_tables(con, schema)
+
+
+def create_publishes_v1_table(con):
+    con.execute("""
+            CREATE TABLE IF NOT EXISTS publishes 
+            (MESSAGE VARCHAR(100), 
+            ASSET_ID VARCHAR(100), 
+            BLOCK_NUMBER INTEGER, 
+            TIME_ASSET_CREATED TIMESTAMP, 
+            TIME_OF_TRANSACTION TIMESTAMP, 
+            TRAC_PRICE FLOAT, 
+            EPOCHS_NUMBER INTEGER, 
+            EPOCH_LENGTH_DAYS FLOAT, 
+            PUBLISHER_ADDRESS VARCHAR(100), 
+            SENT_ADDRESS VARCHAR(100), 
+            TRANSACTION_HASH VARCHAR(100) PRIMARY KEY, 
+            BLOCK_HASH VARCHAR(100))
+        """)
+
+
+def create_publishes_v2_table(con):
+    # Hashes and addresses as their raw 32 and 20 bytes instead of hex strings. FSST already stores the hex close
+    # to that size, so the table shrinks far less than the halved values suggest.
+    con.execute("""
+            CREATE TABLE IF NOT EXISTS publishes_v2 
+            (ASSET_ID UBIGINT, 
+            BLOCK_NUMBER UBIGINT, 
+            TIME_ASSET_CREATED TIMESTAMP, 
+            TIME_OF_TRANSACTION TIMESTAMP, 
+            TRAC_PRICE DECIMAL(38, 18), 
+            EPOCHS_NUMBER USMALLINT, 
+            EPOCH_LENGTH_SECONDS UINTEGER, 
+            PUBLISHER_ADDRESS BLOB, 
+            SENT_ADDRESS BLOB, 
+            TRANSACTION_HASH BLOB PRIMARY KEY, 
+            BLOCK_HASH BLOB)
+        """)
+
+
+def create_publishes_v3_tables(con):
+    # Star schema: one small table per address role, and a fact table that only keeps their keys
+    for table, key, _ in PUBLISHES_DIMENSIONS:
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} 
+            ({key} UINTEGER PRIMARY KEY, 
+            ADDRESS BLOB UNIQUE)
+        """)
+
+    con.execute("""
+            CREATE TABLE IF NOT EXISTS publishes_v3 
+            (ASSET_ID UBIGINT, 
+            CONTRACT_KEY UINTEGER, 
+            BLOCK_NUMBER UBIGINT, 
+            TIME_ASSET_CREATED TIMESTAMP, 
+            TIME_OF_TRANSACTION TIMESTAMP, 
+            TRAC_PRICE DECIMAL(38, 18), 
+            EPOCHS_NUMBER USMALLINT, 
+            EPOCH_LENGTH_SECONDS UINTEGER, 
+            PUBLISHER_KEY UINTEGER, 
+            RECIPIENT_KEY UINTEGER, 
+            TRANSACTION_HASH BLOB PRIMARY KEY, 
+            BLOCK_HASH BLOB)
+        """)
+
+
+def create_rollup_tables(con, schema=PUBLISHES_SCHEMA):
+    table = publishes_table(schema)
+    publisher, publisher_type, trac_type = ROLLUP_COLUMNS[table]
+    created = False
+    for suffix, _ in ROLLUP_GRANULARITIES:
+        exists = con.execute(
+            "SELECT count(*) FROM duckdb_tables() WHERE table_name = ? AND schema_name = current_schema()",
+            [f'{table}_{suffix}']
+        ).fetchone()[0]
+        if exists:
+            continue
+        con.execute(f"""
+            CREATE TABLE {table}_{suffix} 
+            (BUCKET TIMESTAMP, 
+            {publisher} {publisher_type}, 
+            PUBLISHES BIGINT, 
+            TRAC_SUM {trac_type}, 
+            TRAC_AVG DOUBLE, 
+            ASSETS BIGINT)
+        """)
+        created = True
+
+    # New rollups start from the rows already loaded
+    if created:
+        update_rollups(con, table, schema)
+
+
+def update_rollups(con, relation, schema=PUBLISHES_SCHEMA):
+    # Recomputes every rollup bucket that holds a TIME_OF_TRANSACTION of relation from the publishes table.
+    # Only those buckets are deleted and reinserted; the time range keeps the scan to the rows they cover.
+    table = publishes_table(schema)
+    publisher = ROLLUP_COLUMNS[table][0]
+    for suffix, part in ROLLUP_GRANULARITIES:
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE rollup_buckets AS 
+            SELECT DISTINCT date_trunc('{part}', TIME_OF_TRANSACTION) AS BUCKET 
+            FROM {relation} 
+            WHERE TIME_OF_TRANSACTION IS NOT NULL
+        """)
+        first, last = con.execute("SELECT min(BUCKET), max(BUCKET) FROM rollup_buckets").fetchone()
+        if first is None:
+            continue
+
+        con.execute(f"DELETE FROM {table}_{suffix} WHERE BUCKET IN (SELECT BUCKET FROM rollup_buckets)")
+        con.execute(f"""
+            INSERT INTO {table}_{suffix} 
+            SELECT date_trunc('{part}', TIME_OF_TRANSACTION) AS BUCKET, 
+                {publisher}, 
+                count(*), 
+                sum(TRAC_PRICE), 
+                avg(TRAC_PRICE), 
+                count(DISTINCT ASSET_ID) 
+            FROM {table} 
+            WHERE TIME_OF_TRANSACTION >= ? AND TIME_OF_TRANSACTION < ? + INTERVAL 1 {part} 
+            AND date_trunc('{part}', TIME_OF_TRANSACTION) IN (SELECT BUCKET FROM rollup_buckets) 
+            GROUP BY ALL 
+            ORDER BY BUCKET
+        """, [first, last])
+    con.execute("DROP TABLE IF EXISTS rollup_buckets")
+
+
+def hex_to_blob(column):
+    # '0x'-prefixed hex string to its bytes
+    return f"unhex(substr({column}, 3))"
+
+
+def publishes_select(source, schema=PUBLISHES_SCHEMA):
+    # SELECT turning batch rows from source (aliased b) into rows of the publishes table of schema. The v3 key
+    # lookups are joins, which shuffle rows, so v3 restores block order to keep time and hash columns compressible.
+    table = publishes_table(schema)
+    if table == 'publishes':
+        return f"SELECT b.* EXCLUDE (ASSET_CONTRACT) FROM {source} b"
+    if table == 'publishes_v2':
+        return f"""
+            SELECT CAST(b.ASSET_ID AS UBIGINT) AS ASSET_ID, 
+                CAST(b.BLOCK_NUMBER AS UBIGINT) AS BLOCK_NUMBER, 
+                b.TIME_ASSET_CREATED, 
+                b.TIME_OF_TRANSACTION, 
+                CAST(b.TRAC_PRICE AS DECIMAL(38, 18)) AS TRAC_PRICE, 
+                CAST(b.EPOCHS_NUMBER AS USMALLINT) AS EPOCHS_NUMBER, 
+                CAST(round(b."EPOCH_LENGTH-(DAYS)" * 86400) AS UINTEGER) AS EPOCH_LENGTH_SECONDS, 
+                {hex_to_blob('b.PUBLISHER_ADDRESS')} AS PUBLISHER_ADDRESS, 
+                {hex_to_blob('b.SENT_ADDRESS')} AS SENT_ADDRESS, 
+                {hex_to_blob('b.TRANSACTION_HASH')} AS TRANSACTION_HASH, 
+                {hex_to_blob('b.BLOCK_HASH')} AS BLOCK_HASH
+            FROM {source} b
+        """
+    return f"""
+        SELECT CAST(b.ASSET_ID AS UBIGINT) AS ASSET_ID, 
+            c.CONTRACT_KEY, 
+            CAST(b.BLOCK_NUMBER AS UBIGINT) AS BLOCK_NUMBER, 
+            b.TIME_ASSET_CREATED, 
+            b.TIME_OF_TRANSACTION, 
+            CAST(b.TRAC_PRICE AS DECIMAL(38, 18)) AS TRAC_PRICE, 
+            CAST(b.EPOCHS_NUMBER AS USMALLINT) AS EPOCHS_NUMBER, 
+            CAST(round(b."EPOCH_LENGTH-(DAYS)" * 86400) AS UINTEGER) AS EPOCH_LENGTH_SECONDS, 
+            p.PUBLISHER_KEY, 
+            r.RECIPIENT_KEY, 
+            {hex_to_blob('b.TRANSACTION_HASH')} AS TRANSACTION_HASH, 
+            {hex_to_blob('b.BLOCK_HASH')} AS BLOCK_HASH
+        FROM {source} b 
+        LEFT JOIN asset_contracts c ON c.ADDRESS = {hex_to_blob('b.ASSET_CONTRACT')} 
+        LEFT JOIN publishers p ON p.ADDRESS = {hex_to_blob('b.PUBLISHER_ADDRESS')} 
+        LEFT JOIN recipients r ON r.ADDRESS = {hex_to_blob('b.SENT_ADDRESS')} 
+        ORDER BY b.BLOCK_NUMBER, b.TRANSACTION_HASH
+    """
+
+
+def upsert_dimensions(con, relation):
+    # Adds the addresses of relation's enriched rows that have no key yet, numbered on from the largest key.
+    # Only the batch's distinct addresses are compared, never the fact table.
+    for table, key, column in PUBLISHES_DIMENSIONS:
+        con.execute(f"""
+            INSERT INTO {table} 
+            SELECT (SELECT coalesce(max({key}), 0) FROM {table}) + row_number() OVER (ORDER BY a.ADDRESS), 
+                a.ADDRESS 
+            FROM (SELECT DISTINCT {hex_to_blob(column)} AS ADDRESS 
+                  FROM {relation} 
+                  WHERE MESSAGE = 'Success' AND {column} IS NOT NULL) a 
+            WHERE NOT EXISTS (SELECT 1 FROM {table} d WHERE d.ADDRESS = a.ADDRESS)
+        """)
+
+
+def migrate_publishes(con, schema):
+    # Copies publishes into the publishes table of schema (v2 or v3) in one transaction and leaves publishes
+    # as it is. Hashes already copied are skipped, so it can run again after loads have switched over.
+    # publishes has no asset contract, so copied v3 rows have no CONTRACT_KEY.
+    table = publishes_table(schema)
+    create_publishes_table(con, schema)
+    create_dead_letter_table(con)
+    con.execute("""
+        CREATE OR REPLACE TEMP VIEW publishes_v1_rows AS 
+        SELECT 'Success' AS MESSAGE, ASSET_ID, BLOCK_NUMBER, TIME_ASSET_CREATED, TIME_OF_TRANSACTION, TRAC_PRICE, 
+            EPOCHS_NUMBER, EPOCH_LENGTH_DAYS AS "EPOCH_LENGTH-(DAYS)", PUBLISHER_ADDRESS, SENT_ADDRESS, 
+            TRANSACTION_HASH, BLOCK_HASH, CAST(NULL AS VARCHAR) AS ASSET_CONTRACT 
+        FROM publishes
+    """)
+
+    con.begin()
+    try:
+        before = con.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+        merge_publishes(con, 'publishes_v1_rows', 'anti_join', schema=schema)
+        copied = con.execute(f"SELECT count(*) FROM {table}").fetchone()[0] - before
+
+        missing = con.execute(f"""
+            SELECT count(*) 
+            FROM publishes b 
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {table} p WHERE p.TRANSACTION_HASH = {hex_to_blob('b.TRANSACTION_HASH')})
+        """).fetchone()[0]
+        if missing:
+            raise RuntimeError(f"{missing} publishes rows are missing from {table} after the copy.")
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return copied
+
+
+def create_dead_letter_table(con):
+    # publishes rows whose transaction lookup failed, kept until ot_dead_letter_flow enriches them
+    con.execute("""
+            CREATE TABLE IF NOT EXISTS enrichment_dead_letters 
+            (ASSET_ID VARCHAR(100), 
+            BLOCK_NUMBER INTEGER, 
+            TIME_ASSET_CREATED TIMESTAMP, 
+            TIME_OF_TRANSACTION TIMESTAMP, 
+            TRAC_PRICE DECIMAL(38, 18), 
+            EPOCHS_NUMBER INTEGER, 
+            EPOCH_LENGTH_DAYS FLOAT, 
+            TRANSACTION_HASH VARCHAR(100) PRIMARY KEY, 
+            BLOCK_HASH VARCHAR(100), 
+            REASON VARCHAR, 
+            ATTEMPTS INTEGER, 
+            FIRST_FAILED_AT TIMESTAMP, 
+            LAST_FAILED_AT TIMESTAMP, 
+            NEXT_ATTEMPT_AT TIMESTAMP, 
+            ASSET_CONTRACT VARCHAR(100))
+        """)
+    # Tables created before the asset contract was carried get it as a last column
+    con.execute("ALTER TABLE enrichment_dead_letters ADD COLUMN IF NOT EXISTS ASSET_CONTRACT VARCHAR(100)")
+
+
+def create_service_agreement_event_tables(con):
+    con.execute("""
+            CREATE TABLE IF NOT EXISTS service_agreement_extended 
+            (AGREEMENT_ID VARCHAR(100), 
+            EPOCHS_NUMBER INTEGER, 
+            BLOCK_NUMBER INTEGER, 
+            TRANSACTION_HASH VARCHAR(100), 
+            LOG_INDEX INTEGER, 
+            BLOCK_HASH VARCHAR(100), 
+            PRIMARY KEY (TRANSACTION_HASH, LOG_INDEX))
+        """)
+
+    con.execute("""
+            CREATE TABLE IF NOT EXISTS service_agreement_reward_raised 
+            (AGREEMENT_ID VARCHAR(100), 
+            TRAC_AMOUNT DECIMAL(38, 18), 
+            BLOCK_NUMBER INTEGER, 
+            TRANSACTION_HASH VARCHAR(100), 
+            LOG_INDEX INTEGER, 
+            BLOCK_HASH VARCHAR(100), 
+            PRIMARY KEY (TRANSACTION_HASH, LOG_INDEX))
+        """)
+
+    con.execute("""
+            CREATE TABLE IF NOT EXISTS service_agreement_terminated 
+            (AGREEMENT_ID VARCHAR(100), 
+            BLOCK_NUMBER INTEGER, 
+            TRANSACTION_HASH VARCHAR(100), 
+            LOG_INDEX INTEGER, 
+            BLOCK_HASH VARCHAR(100), 
+            PRIMARY KEY (TRANSACTION_HASH, LOG_INDEX))
+        """)
+
+    con.execute("""
+            CREATE TABLE IF NOT EXISTS service_agreement_update_reward_raised 
+            (AGREEMENT_ID VARCHAR(100), 
+            UPDATE_TRAC_AMOUNT DECIMAL(38, 18), 
+            BLOCK_NUMBER INTEGER, 
+            TRANSACTION_HASH VARCHAR(100), 
+            LOG_INDEX INTEGER, 
+            BLOCK_HASH VARCHAR(100), 
+            PRIMARY KEY (TRANSACTION_HASH, LOG_INDEX))
+        """)
+    # Tables created when the amounts were stored as FLOAT get the exact decimal type
+    for table, column in (("service_agreement_reward_raised", "TRAC_AMOUNT"),
+                          ("service_agreement_update_reward_raised", "UPDATE_TRAC_AMOUNT")):
+        data_type = con.execute("""
+            SELECT data_type FROM information_schema.columns 
+            WHERE table_schema = current_schema() AND table_name = ? AND column_name = ?
+        """, [table, column]).fetchone()
+        if data_type is not None and data_type[0] != 'DECIMAL(38,18)':
+            con.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE DECIMAL(38, 18)")
+
+
+def create_ingestion_state_table(con):
+    con.execute("""
+            CREATE TABLE IF NOT EXISTS ingestion_state 
+            (STREAM VARCHAR(200) PRIMARY KEY, 
+            CONTRACT_ADDRESS VARCHAR(100), 
+            EVENT_NAME VARCHAR(100), 
+            LAST_BLOCK_NUMBER INTEGER, 
+            LAST_BLOCK_HASH VARCHAR(100), 
+            RUN_ID VARCHAR(100), 
+            UPDATED_AT TIMESTAMP)
+        """)
+
+
+def read_ingestion_cursor(con, stream):
+    # Primary-key point read, independent of the size of publishes
+    row = con.execute("""
+        SELECT LAST_BLOCK_NUMBER, LAST_BLOCK_HASH, RUN_ID 
+        FROM ingestion_state 
+        WHERE STREAM = ?
+    """, [stream]).fetchone()
+
+    if row is None:
+        return None
+    return {'block_number': row[0], 'block_hash': row[1], 'run_id': row[2]}
+
+
+def create_recent_blocks_table(con):
+    con.execute("""
+            CREATE TABLE IF NOT EXISTS recent_blocks 
+            (STREAM VARCHAR(200), 
+            BLOCK_NUMBER INTEGER, 
+            BLOCK_HASH VARCHAR(100), 
+            PARENT_HASH VARCHAR(100), 
+            PRIMARY KEY (STREAM, BLOCK_NUMBER))
+        """)
+
+
+def save_ingestion_cursor(con, cursor):
+    # Callers run this inside their load transaction
+    con.execute(
+        "INSERT OR REPLACE INTO ingestion_state VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [cursor['stream'], cursor['contract_address'], cursor['event_name'], cursor['block_number'],
+         cursor['block_hash'], cursor['run_id'], datetime.datetime.utcnow()]
+    )
+
+    if cursor.get('recent_blocks'):
+        con.register('recent_block_headers', pl.DataFrame(
+            [(cursor['stream'], number, block_hash, parent_hash)
+             for number, block_hash, parent_hash in cursor['recent_blocks']],
+            schema={"STREAM": pl.Utf8, "BLOCK_NUMBER": pl.Int64, "BLOCK_HASH": pl.Utf8, "PARENT_HASH": pl.Utf8}
+        ))
+        con.execute("INSERT OR REPLACE INTO recent_blocks SELECT * FROM recent_block_headers")
+        con.unregister('recent_block_headers')
+
+    # Keep only the rolling window
+    con.execute(
+        "DELETE FROM recent_blocks WHERE STREAM = ? AND BLOCK_NUMBER <= ?",
+        [cursor['stream'], cursor['block_number'] - REORG_WINDOW]
+    )
+
+
+def fetch_block_headers(rpc_url, block_numbers):
+    # Uncached on purpose: these are the canonical hashes the stored ones are checked against
+    blocks = rpc_batch(rpc_url, 'eth_getBlockByNumber', [[hex(number), False] for number in block_numbers])
+    return [(number, block['hash'], block['parentHash']) if block is not None else (number, None, None)
+            for number, block in zip(block_numbers, blocks)]
+
+
+def find_reorg_block(con, rpc_url, stream, cursor):
+    # Returns the first block to re-ingest, or None while the chain still builds on the cursor block
+    _, _, parent_hash = fetch_block_headers(rpc_url, [cursor['block_number'] + 1])[0]
+    if parent_hash is None or parent_hash == cursor['block_hash']:
+        return None
+
+    print(f"Block {cursor['block_number'] + 1} does not build on stored block {cursor['block_number']}, "
+          f"looking for the fork point.")
+
+    window = con.execute("""
+        SELECT BLOCK_NUMBER, BLOCK_HASH 
+        FROM recent_blocks 
+        WHERE STREAM = ? 
+        ORDER BY BLOCK_NUMBER
+    """, [stream]).fetchall()
+
+    if not window:
+        return max(0, cursor['block_number'] - REORG_WINDOW + 1)
+
+    canonical = fetch_block_headers(rpc_url, [number for number, _ in window])
+
+    # Newest block whose stored hash is still canonical; everything after it was orphaned
+    for (number, stored_hash), (_, canonical_hash, _) in zip(reversed(window), reversed(canonical)):
+        if stored_hash == canonical_hash:
+            return number + 1
+
+    print(f"Reorg is deeper than the {REORG_WINDOW}-block window, rewinding to block {window[0][0]}.")
+    return window[0][0]
+
+
+def rewind_stream(con, stream, fork_block):
+    # Deletes everything from the fork point on and moves the cursor back in one transaction. The rows are
+    # shared by every stream on the network (one schema per network), so their cursors move back too. The
+    # landing files lose the same rows: rewritten before the commit, swapped in after it.
+    landing_rewind = []
+    con.begin()
+    try:
+        # The landing zone keeps v1 rows, with hashes as 0x-prefixed hex
+        hash_column = ('TRANSACTION_HASH' if publishes_table() == 'publishes'
+                       else "'0x' || lower(hex(TRANSACTION_HASH))")
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE rewound_publishes AS 
+            SELECT TIME_OF_TRANSACTION, {hash_column} AS TRANSACTION_HASH 
+            FROM {publishes_table()} WHERE BLOCK_NUMBER >= ?
+        """, [fork_block])
+        deleted = con.execute(f"DELETE FROM {publishes_table()} WHERE BLOCK_NUMBER >= ?",
+                              [fork_block]).fetchone()[0]
+        update_rollups(con, 'rewound_publishes')
+        transaction_hashes = [row[0] for row in con.execute(
+            "SELECT TRANSACTION_HASH FROM rewound_publishes").fetchall()]
+        con.execute("DROP TABLE rewound_publishes")
+        for _, table, _ in SERVICE_AGREEMENT_LIFECYCLE_EVENTS.values():
+            con.execute(f"DELETE FROM {table} WHERE BLOCK_NUMBER >= ?", [fork_block])
+        con.execute("DELETE FROM enrichment_dead_letters WHERE BLOCK_NUMBER >= ?", [fork_block])
+        parent = con.execute(
+            "SELECT BLOCK_HASH FROM recent_blocks WHERE STREAM = ? AND BLOCK_NUMBER = ?",
+            [stream, fork_block - 1]
+        ).fetchone()
+        con.execute("DELETE FROM recent_blocks WHERE BLOCK_NUMBER >= ?", [fork_block])
+        con.execute("""
+            UPDATE ingestion_state 
+            SET LAST_BLOCK_NUMBER = ?, LAST_BLOCK_HASH = ?, UPDATED_AT = ? 
+            WHERE STREAM = ? OR LAST_BLOCK_NUMBER >= ?
+        """, [fork_block - 1, parent[0] if parent else None, datetime.datetime.utcnow(), stream, fork_block])
+        landing_rewind = stage_landing_rewind(transaction_hashes, fork_block)
+        con.commit()
+    except Exception:
+        con.rollback()
+        discard_landing_rewind(landing_rewind)
+        raise
+    apply_landing_rewind(landing_rewind)
+
+    print(f"Reorg: removed {deleted} rows from block {fork_block} on.")
+
+
+def current_run_id():
+    return str(flow_run.id or uuid.uuid4())
+
+
+def insert_publishes(con, df, landing=None):
+    con.register('df', df)
+    try:
+        return merge_publishes(con, 'df', landing=landing)
+    finally:
+        con.unregister('df')
+
+
+def merge_publishes(con, relation, strategy=LOAD_STRATEGY, landing=None, schema=PUBLISHES_SCHEMA):
+    # relation is any table, view or registered frame with the publishes columns. Enriched rows go to
+    # the publishes table of schema and leave the dead-letter table; rows whose lookup failed are dead-lettered
+    # instead. With landing=(prefix, key) the enriched rows are also written to the landing zone.
+    # Returns (rows enriched, rows dead-lettered, landing files written).
+    if strategy not in LOAD_STRATEGIES:
+        raise ValueError(f"Unknown load strategy {strategy!r}, expected one of {LOAD_STRATEGIES}")
+
+    table = publishes_table(schema)
+    enriched, failed = con.execute(f"""
+        SELECT count(*) FILTER (WHERE MESSAGE = 'Success'), 
+            count(*) FILTER (WHERE MESSAGE IS DISTINCT FROM 'Success') 
+        FROM {relation}
+    """).fetchone()
+
+    # Batches always come as v1 rows; v2 and v3 convert them on insert and compare hashes as bytes
+    key = 'b.TRANSACTION_HASH' if table == 'publishes' else hex_to_blob('b.TRANSACTION_HASH')
+    if table == 'publishes_v3':
+        upsert_dimensions(con, relation)
+    new_rows = f"""
+        SELECT DISTINCT ON (b.TRANSACTION_HASH) b.* 
+        FROM {relation} b 
+        WHERE b.MESSAGE = 'Success' 
+        AND NOT EXISTS (SELECT 1 FROM {table} p WHERE p.TRANSACTION_HASH = {key})
+    """
+
+    landing_files = []
+    writes_landing = landing is not None and LANDING_DIR
+    if writes_landing:
+        # The landing zone gets exactly the rows publishes gets. Every strategy inserts only the hashes not
+        # loaded yet, so the anti-join result taken before the insert is that set, whichever strategy runs.
+        con.execute(f"CREATE OR REPLACE TEMP TABLE publishes_new AS {new_rows}")
+        new_rows = "SELECT * FROM publishes_new"
+
+    if strategy == 'anti_join':
+        # The batch is already an unindexed relation (a registered frame or a staging table), so one hash
+        # anti-join against publishes drops the loaded hashes and only new rows reach the primary key
+        con.execute(f"INSERT INTO {table} {publishes_select(f'({new_rows})', schema)}")
+    elif strategy == 'on_conflict':
+        con.execute(f"""
+            INSERT INTO {table}
+            {publishes_select(f"(SELECT * FROM {relation} WHERE MESSAGE = 'Success')", schema)}
+            ON CONFLICT (TRANSACTION_HASH)  -- this is the primary key
+            DO NOTHING;
+        """)
+    elif strategy == 'merge':
+        # A hash repeated within the batch would be inserted twice, so the source keeps one row per hash
+        batch_rows = f"(SELECT DISTINCT ON (TRANSACTION_HASH) * FROM {relation} WHERE MESSAGE = 'Success')"
+        con.execute(f"""
+            MERGE INTO {table} 
+            USING ({publishes_select(batch_rows, schema)}) b 
+            ON {table}.TRANSACTION_HASH = b.TRANSACTION_HASH 
+            WHEN NOT MATCHED THEN INSERT
+        """)
+
+    if writes_landing:
+        landing_files = write_landing_files(con, 'publishes_new', *landing)
+        con.execute("DROP TABLE publishes_new")
+
+    if enriched > 0:
+        update_rollups(con, f"(SELECT TIME_OF_TRANSACTION FROM {relation} WHERE MESSAGE = 'Success')", schema)
+
+    con.execute(f"""
+        DELETE FROM enrichment_dead_letters 
+        WHERE TRANSACTION_HASH IN (SELECT TRANSACTION_HASH FROM {relation} WHERE MESSAGE = 'Success')
+    """)
+
+    if failed > 0:
+        record_dead_letters(con, relation)
+
+    return enriched, failed, landing_files
+
+
+def write_landing_files(con, relation, prefix, key=None):
+    # One file per day, named after the batch: prefix plus key, or the batch's first block. A retried batch
+    # starts at the same block and overwrites its own files instead of adding duplicates.
+    df = con.execute(f"""
+        SELECT *, CAST(coalesce(TIME_OF_TRANSACTION, TIME_ASSET_CREATED) AS DATE) AS DAY 
+        FROM {relation} 
+        ORDER BY BLOCK_NUMBER, TRANSACTION_HASH
+    """).pl()
+    if df.height == 0:
+        return []
+    name = f"{prefix.replace(':', '_')}-{df['BLOCK_NUMBER'][0] if key is None else key}.parquet"
+
+    landing_files = []
+    try:
+        for part in df.partition_by('DAY', maintain_order=True):
+            path = os.path.join(LANDING_DIR, 'publishes', f"DAY={part['DAY'][0]}", name)
+            write_atomically(path, lambda temporary_path: part.drop('DAY').write_parquet(
+                temporary_path, statistics=True, row_group_size=LANDING_ROW_GROUP_SIZE))
+            landing_files.append(path)
+    except Exception:
+        remove_landing_files(landing_files)
+        raise
+
+    create_landing_views()
+    return landing_files
+
+
+def remove_landing_files(landing_files):
+    # Undoes write_landing_files when the load transaction rolls back
+    for path in landing_files:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def compact_landing_files(landing_files, min_files=LANDING_COMPACT_FILES):
+    # Every stream head writes its own small file per day. Once a day the load wrote to holds min_files files,
+    # they are rewritten as one file sorted by block and named after its first block. Called after the load has
+    # committed, with loads of the landing zone running one at a time. A hash found twice, left behind by a
+    # compaction that stopped before removing its inputs, is written once.
+    compacted = 0
+    for day_dir in dict.fromkeys(os.path.dirname(path) for path in landing_files):
+        paths = sorted(glob.glob(os.path.join(day_dir, '*.parquet')))
+        if len(paths) < max(min_files, 2):
+            continue
+
+        try:
+            with duckdb.connect() as landing_con:
+                df = landing_con.execute("""
+                    SELECT DISTINCT ON (TRANSACTION_HASH) * 
+                    FROM read_parquet(?, hive_partitioning = false, union_by_name = true) 
+                    ORDER BY BLOCK_NUMBER, TRANSACTION_HASH
+                """, [paths]).pl()
+            path = os.path.join(day_dir, f"compacted-{df['BLOCK_NUMBER'][0]}.parquet")
+            write_atomically(path, lambda temporary_path: df.write_parquet(
+                temporary_path, statistics=True, row_group_size=LANDING_ROW_GROUP_SIZE))
+            remove_landing_files([other for other in paths if other != path])
+            compacted += 1
+        except Exception as error:
+            # The files are all still there, the day is compacted on a later load
+            print(f"Landing day {os.path.basename(day_dir)} not compacted: {error}")
+
+    return compacted
+
+
+def stage_landing_rewind(transaction_hashes, fork_block, landing_dir=LANDING_DIR):
+    # Rewrites the landing files holding rows a rewind removes, without those rows. The new contents are staged
+    # next to each file and only swapped in by apply_landing_rewind once the rewind has committed. Returns
+    # (path, staged path, or None when no rows are left) pairs. Reads through a local connection, since the
+    # pipeline's MotherDuck connection cannot open local files.
+    if not landing_dir or not transaction_hashes or not glob.glob(landing_glob(landing_dir)):
+        return []
+
+    staged = []
+    try:
+        with duckdb.connect() as landing_con:
+            landing_con.execute("CREATE TABLE rewound AS SELECT unnest(?::VARCHAR[]) AS TRANSACTION_HASH",
+                                [transaction_hashes])
+            # Row-group statistics on BLOCK_NUMBER skip everything older than the fork
+            paths = [row[0] for row in landing_con.execute(f"""
+                SELECT DISTINCT filename 
+                FROM read_parquet('{landing_glob(landing_dir)}', filename = true, union_by_name = true) 
+                WHERE BLOCK_NUMBER >= ? AND TRANSACTION_HASH IN (SELECT TRANSACTION_HASH FROM rewound)
+            """, [fork_block]).fetchall()]
+
+            for path in paths:
+                df = landing_con.execute("""
+                    SELECT * FROM read_parquet(?, hive_partitioning = false) 
+                    WHERE TRANSACTION_HASH NOT IN (SELECT TRANSACTION_HASH FROM rewound) 
+                    ORDER BY BLOCK_NUMBER, TRANSACTION_HASH
+                """, [path]).pl()
+                if df.height == 0:
+                    staged.append((path, None))
+                    continue
+                df.write_parquet(f'{path}.rewind', statistics=True, row_group_size=LANDING_ROW_GROUP_SIZE)
+                staged.append((path, f'{path}.rewind'))
+    except Exception:
+        discard_landing_rewind(staged)
+        raise
+    return staged
+
+
+def apply_landing_rewind(staged):
+    for path, staged_path in staged:
+        if staged_path is not None:
+            os.replace(staged_path, path)
+        else:
+            remove_landing_files([path])
+
+
+def discard_landing_rewind(staged):
+    remove_landing_files([staged_path for _, staged_path in staged if staged_path is not None])
+
+
+def landing_glob(landing_dir=LANDING_DIR):
+    return os.path.join(os.path.abspath(landing_dir), 'publishes', '*', '*.parquet')
+
+
+def create_landing_views(landing_dir=LANDING_DIR):
+    # Local analytics database over the landing zone; DAY filters prune whole partition folders
+    database_path = os.path.join(landing_dir, 'landing.db')
+    if os.path.exists(database_path):
+        return
+    try:
+        with duckdb.connect(database_path) as landing_con:
+            landing_con.execute(f"""
+                CREATE OR REPLACE VIEW publishes_landing AS 
+                SELECT * 
+                FROM read_parquet('{landing_glob(landing_dir)}', hive_partitioning = true, union_by_name = true)
+            """)
+    except duckdb.IOException as error:
+        print(f"Landing views not created: {error}")
+
+
+def resync_from_landing(con, start_day=None, end_day=None):
+    # Merges the landing partitions between start_day and end_day (ISO dates, inclusive) into publishes,
+    # reading only those DAY folders. Files written before ASSET_CONTRACT was added read it as NULL.
+    days = [f"DAY >= '{datetime.date.fromisoformat(start_day)}'" if start_day else None,
+            f"DAY <= '{datetime.date.fromisoformat(end_day)}'" if end_day else None]
+    con.execute(f"""
+        CREATE OR REPLACE TEMP VIEW landing_publishes AS 
+        SELECT {', '.join(f'"{column}"' for column in PUBLISHES_COLUMNS)} 
+        FROM read_parquet('{landing_glob()}', hive_partitioning = true, union_by_name = true) 
+        WHERE {' AND '.join(day for day in days if day) or 'true'}
+    """)
+
+    con.begin()
+    try:
+        enriched, _, _ = merge_publishes(con, 'landing_publishes')
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return enriched
+
+
+def record_dead_letters(con, relation):
+    # A hash failing again keeps its first failure time and waits twice as long before the next attempt
+    now = datetime.datetime.utcnow()
+    con.execute(f"""
+        INSERT OR REPLACE INTO enrichment_dead_letters
+        SELECT f.ASSET_ID, f.BLOCK_NUMBER, f.TIME_ASSET_CREATED, f.TIME_OF_TRANSACTION, f.TRAC_PRICE, 
+            f.EPOCHS_NUMBER, f."EPOCH_LENGTH-(DAYS)", f.TRANSACTION_HASH, f.BLOCK_HASH, 
+            coalesce(f.MESSAGE, 'No transaction returned'), 
+            coalesce(d.ATTEMPTS, 0) + 1, 
+            coalesce(d.FIRST_FAILED_AT, ?), 
+            ?, 
+            ? + INTERVAL 1 SECOND * CAST(least(? * pow(2, coalesce(d.ATTEMPTS, 0)), ?) AS BIGINT), 
+            f.ASSET_CONTRACT
+        FROM (SELECT DISTINCT ON (TRANSACTION_HASH) * 
+              FROM {relation} 
+              WHERE MESSAGE IS DISTINCT FROM 'Success') f
+        LEFT JOIN enrichment_dead_letters d USING (TRANSACTION_HASH)
+    """, [now, now, now, DEAD_LETTER_BACKOFF_SECONDS, DEAD_LETTER_MAX_BACKOFF_SECONDS])
+
+
+def staged_batch(processed_events, hash_list, headers):
+    # The transform's inputs as they come out of extract and enrichment, for insert_staged_batch
+    return {
+        "events": processed_events,
+        "transactions": transactions_frame(hash_list),
+        "blocks": headers_frame(headers)
+    }
+
+
+def insert_staged_batch(con, batch, landing=None):
+    # Bulk-loads the raw frames into staging tables; a single set-based statement then does what
+    # publishes_frame does in Polars (unit scaling, renames and the enrichment and block joins)
+    for name, frame in batch.items():
+        con.register(f'raw_{name}', frame)
+        con.execute(f"CREATE OR REPLACE TEMP TABLE staging_{name} AS SELECT * FROM raw_{name}")
+        con.unregister(f'raw_{name}')
+
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE staged_publishes AS
+        SELECT t.MESSAGE, 
+            CAST(e.tokenId AS VARCHAR) AS ASSET_ID, 
+            e.blockNumber AS BLOCK_NUMBER, 
+            e.startTime AS TIME_ASSET_CREATED, 
+            epoch_ms(b.BLOCK_TIMESTAMP * 1000) AS TIME_OF_TRANSACTION, 
+            e.tokenAmount AS TRAC_PRICE, 
+            e.epochsNumber AS EPOCHS_NUMBER, 
+            e.epochLength / 86400 AS "EPOCH_LENGTH-(DAYS)", 
+            t.PUBLISHER_ADDRESS, 
+            t.SENT_ADDRESS, 
+            e.transactionHash AS TRANSACTION_HASH, 
+            e.blockHash AS BLOCK_HASH, 
+            e.assetContract AS ASSET_CONTRACT
+        FROM staging_events e
+        LEFT JOIN staging_transactions t ON t.TRANSACTION_HASH = e.transactionHash
+        LEFT JOIN staging_blocks b ON b.BLOCK_NUMBER = e.blockNumber
+    """)
+
+    return merge_publishes(con, 'staged_publishes', landing=landing)
+
+
+def insert_batch(con, batch, landing=None):
+    # A transformed publishes DataFrame (or Arrow table), or the staged_batch frames with TRANSFORM_MODE=sql
+    if isinstance(batch, dict):
+        return insert_staged_batch(con, batch, landing)
+    return insert_publishes(con, batch, landing)
+
+
+def insert_lifecycle_events(con, lifecycle_events):
+    # One typed table per lifecycle event; callers run this inside their load transaction
+    for event_name, table, value_name in SERVICE_AGREEMENT_LIFECYCLE_EVENTS.values():
+        events = lifecycle_events.get(table) if lifecycle_events else None
+        if not events:
+            continue
+
+        # (column, Arrow type) for the value argument; amounts are uint96 wei, too wide for Int64, and are
+        # read at scale 18 through the same decimal view as the publish tokenAmount
+        value_column = {
+            'epochsNumber': ("EPOCHS_NUMBER", pa.int64()),
+            'tokenAmount': ("TRAC_AMOUNT", TRAC_DECIMAL),
+            'updateTokenAmount': ("UPDATE_TRAC_AMOUNT", TRAC_DECIMAL)
+        }.get(value_name)
+
+        columns = {"AGREEMENT_ID": pa.array([event['agreementId'] for event in events], pa.string())}
+        if value_column is not None:
+            name, dtype = value_column
+            values = [event[value_name] for event in events]
+            if dtype == TRAC_DECIMAL:
+                columns[name] = pa.array(values, pa.decimal128(38, 0)).view(TRAC_DECIMAL)
+            else:
+                columns[name] = pa.array(values, dtype)
+        columns.update({
+            "BLOCK_NUMBER": pa.array([event['blockNumber'] for event in events], pa.int64()),
+            "TRANSACTION_HASH": pa.array([event['transactionHash'] for event in events], pa.string()),
+            "LOG_INDEX": pa.array([event['logIndex'] for event in events], pa.int64()),
+            "BLOCK_HASH": pa.array([event['blockHash'] for event in events], pa.string())
+        })
+        df_events = pa.table(columns)
+
+        con.register('df_events', df_events)
+        con.sql(f"""
+            INSERT INTO {table}
+            SELECT * FROM df_events
+            ON CONFLICT (TRANSACTION_HASH, LOG_INDEX)
+            DO NOTHING;
+        """)
+        con.unregister('df_events')
+        print(f"Inserted {df_events.num_rows} {event_name} events.")
+
+
+def service_agreement_events_frame(columns):
+    # One Arrow conversion per column instead of one dict per event. tokenAmount comes in as wei integers;
+    # the same 128-bit values read at scale 18 are the TRAC amounts, with nothing rounded or copied.
+    amounts = pa.array(columns['tokenAmount'], pa.decimal128(38, 0)).view(TRAC_DECIMAL)
+    return pl.from_arrow(pa.table(dict(columns, tokenAmount=amounts), schema=SERVICE_AGREEMENT_EVENT_SCHEMA))
+
+
+def process_service_agreement_events(events_list):
+    columns = {name: [] for name in SERVICE_AGREEMENT_EVENT_SCHEMA.names}
+    for item in events_list:
+        args = item['args']
+        columns['assetContract'].append(args.get('assetContract'))
+        columns['keyword'].append('0x' + args.get('keyword', b'').hex())
+        columns['hashFunctionId'].append(args.get('hashFunctionId'))
+        columns['startTime'].append(args.get('startTime'))
+        columns['epochsNumber'].append(args.get('epochsNumber'))
+        columns['epochLength'].append(args.get('epochLength'))
+        columns['tokenAmount'].append(args.get('tokenAmount'))
+        columns['event'].append(item.get('event'))
+        columns['tokenId'].append(args.get('tokenId'))
+        columns['transactionHash'].append(item['transactionHash'].hex() if item.get('transactionHash') else None)
+        columns['blockHash'].append(item['blockHash'].hex() if item.get('blockHash') else None)
+        columns['blockNumber'].append(item.get('blockNumber'))
+        columns['address'].append(item.get('address'))
+
+    return service_agreement_events_frame(columns)
+
+
+def get_raw_logs(w3, address, topics, from_block, to_block):
+    # Goes straight to the provider, skipping web3's result formatters and per-log event processing
+    response = w3.provider.make_request('eth_getLogs', [{
+        'address': address,
+        'topics': topics,
+        'fromBlock': hex(from_block),
+        'toBlock': hex(to_block)
+    }])
+
+    if 'error' in response:
+        raise ValueError(response['error'])
+
+    return response['result']
+
+
+def decode_service_agreement_created(logs):
+    # Decodes raw ServiceAgreementV1Created logs into the same frame as process_service_agreement_events.
+    # Indexed topics: assetContract, tokenId. Data words (hex offsets after '0x'): 0 keyword offset,
+    # 1 hashFunctionId, 2 startTime, 3 epochsNumber, 4 epochLength, 5 tokenAmount, then the keyword bytes.
+    checksum_addresses = {}
+
+    def checksum(address):
+        if address not in checksum_addresses:
+            checksum_addresses[address] = Web3.to_checksum_address(address)
+        return checksum_addresses[address]
+
+    # Each field goes straight into its column; the event name is the same for every row
+    columns = {name: [] for name in SERVICE_AGREEMENT_EVENT_SCHEMA.names}
+    asset_contracts = columns['assetContract'].append
+    keywords = columns['keyword'].append
+    hash_function_ids = columns['hashFunctionId'].append
+    start_times = columns['startTime'].append
+    epochs_numbers = columns['epochsNumber'].append
+    epoch_lengths = columns['epochLength'].append
+    token_amounts = columns['tokenAmount'].append
+    token_ids = columns['tokenId'].append
+    transaction_hashes = columns['transactionHash'].append
+    block_hashes = columns['blockHash'].append
+    block_numbers = columns['blockNumber'].append
+    addresses = columns['address'].append
+    for log in logs:
+        topics = log['topics']
+        data = log['data']
+
+        keyword_start = 2 + int(data[2:66], 16) * 2
+        keyword_length = int(data[keyword_start:keyword_start + 64], 16) * 2
+
+        asset_contracts(checksum('0x' + topics[1][26:]))
+        keywords('0x' + data[keyword_start + 64:keyword_start + 64 + keyword_length])
+        hash_function_ids(int(data[66:130], 16))
+        start_times(int(data[130:194], 16))
+        epochs_numbers(int(data[194:258], 16))
+        epoch_lengths(int(data[258:322], 16))
+        token_amounts(int(data[322:386], 16))
+        token_ids(int(topics[2], 16))
+        transaction_hashes(log['transactionHash'])
+        block_hashes(log['blockHash'])
+        block_numbers(int(log['blockNumber'], 16))
+        addresses(checksum(log['address']))
+    columns['event'] = ['ServiceAgreementV1Created'] * len(columns['address'])
+
+    return service_agreement_events_frame(columns)
+
+
+def decode_lifecycle_events(logs):
+    # Indexed topic: agreementId. The single data word, when there is one, is the event's value argument.
+    lifecycle_events = {table: [] for _, table, _ in SERVICE_AGREEMENT_LIFECYCLE_EVENTS.values()}
+    for log in logs:
+        event_name, table, value_name = SERVICE_AGREEMENT_LIFECYCLE_EVENTS[log['topics'][0]]
+        event = {
+            'agreementId': log['topics'][1],
+            'event': event_name,
+            'transactionHash': log['transactionHash'],
+            'blockHash': log['blockHash'],
+            'blockNumber': int(log['blockNumber'], 16),
+            'logIndex': int(log['logIndex'], 16)
+        }
+        if value_name is not None:
+            event[value_name] = int(log['data'][2:66], 16)
+        lifecycle_events[table].append(event)
+
+    return lifecycle_events
+
+
+def decode_service_agreement_logs(logs):
+    # Dispatches the logs of one multi-topic scan by topic0: (publish events, lifecycle events per table)
+    created_logs = []
+    lifecycle_logs = []
+    for log in logs:
+        topic = log['topics'][0]
+        if topic == SERVICE_AGREEMENT_V1_CREATED_TOPIC:
+            created_logs.append(log)
+        elif topic in SERVICE_AGREEMENT_LIFECYCLE_EVENTS:
+            lifecycle_logs.append(log)
+
+    return decode_service_agreement_created(created_logs), decode_lifecycle_events(lifecycle_logs)
+
+
+def iter_service_agreement_logs(w3, from_block, to_block, contract_address=CONTRACT_ADDRESS,
+                                topics=SERVICE_AGREEMENT_TOPICS):
+    # One eth_getLogs per chunk for the whole ServiceAgreementV1 event family
+    return iter_logs_chunked(
+        lambda start, end: get_raw_logs(w3, contract_address, topics, start, end),
+        from_block,
+        to_block
+    )
+
+
+def rpc_batch_requests(method, params_list, batch_size=RPC_BATCH_SIZE):
+    return [[{
+        'jsonrpc': '2.0',
+        'id': batch_start + offset,
+        'method': method,
+        'params': params
+    } for offset, params in enumerate(params_list[batch_start:batch_start + batch_size])]
+        for batch_start in range(0, len(params_list), batch_size)]
+
+
+def rpc_batch_results(batch, response):
+    # Results in request order, with None for calls the node answered with an error
+    if isinstance(response, dict):
+        # A single object instead of a list means the whole batch was rejected
+        raise ValueError(response.get('error', response))
+
+    responses = {item.get('id'): item for item in response}
+    results = []
+    for call in batch:
+        item = responses.get(call['id'])
+        results.append(item.get('result') if item is not None and 'error' not in item else None)
+    return results
+
+
+def rpc_batch(rpc_url, method, params_list, batch_size=RPC_BATCH_SIZE):
+    # Sends the calls as JSON-RPC batches, batch_size calls per HTTP round trip through the endpoint pool
+    pool = rpc_pool_for(rpc_url)
+    results = []
+    for batch in rpc_batch_requests(method, params_list, batch_size):
+        results.extend(rpc_batch_results(batch, pool.request(batch)))
+
+    return results
+
+
+def transactions_from_rpc(hashes, transactions):
+    # eth_getTransactionByHash results in the shape fetch_transaction_data returns
+    return [{
+        "message": "Success",
+        "hash": transaction["hash"],
+        "from": transaction["from"],
+        "to": transaction["to"]
+    } if transaction is not None else failed_lookup(hash, "eth_getTransactionByHash returned no transaction")
+        for hash, transaction in zip(hashes, transactions)]
+
+
+def fetch_transactions_rpc(hashes, rpc_url):
+    return transactions_from_rpc(hashes, rpc_batch(rpc_url, 'eth_getTransactionByHash', [[hash] for hash in hashes]))
+
+
+def transaction_from_subscan(response):
+    if response.get("code") == 0:
+        data = response["data"]
+        return {
+            "message": response["message"],
+            "hash": data["hash"],
+            "from": data["from"],
+            "to": data["to"]["address"]
+        }
+
+
+class SubscanLimiter:
+    # Shared by every Subscan call in the process. A token bucket keeps the request rate under the key's quota
+    # and an AIMD window bounds the requests in flight: the window grows by about one per window of successful
+    # lookups and halves on a rate-limit response, which also empties the bucket so every worker pauses.
+    # Errors and timeouts leave the window where it is; they say nothing about spare quota.
+
+    def __init__(self, rate=SUBSCAN_RATE_LIMIT, initial=2, minimum=SUBSCAN_CONCURRENCY_MIN,
+                 maximum=SUBSCAN_CONCURRENCY_MAX):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.window = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        # 0 once a slot and a token are taken, otherwise how long to wait before trying again
+        with self.lock:
+            now = time.monotonic()
+            if self.rate:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.in_flight >= int(self.window):
+                return 0.01
+            if self.rate and self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+
+            self.tokens -= 1
+            self.in_flight += 1
+            return 0
+
+    def acquire(self):
+        while (delay := self.try_acquire()) > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        while (delay := self.try_acquire()) > 0:
+            await asyncio.sleep(delay)
+
+    def release(self, outcome):
+        # outcome is what subscan_outcome made of the answer: 'ok', 'throttled' or 'error'
+        with self.lock:
+            self.in_flight -= 1
+            self.requests += 1
+            if outcome == 'throttled':
+                self.throttled += 1
+                self.window = max(self.minimum, self.window / 2)
+                self.tokens = 0.0
+            elif outcome == 'ok':
+                self.window = min(self.maximum, self.window + 1 / self.window)
+            else:
+                self.errors += 1
+
+
+SUBSCAN_LIMITERS = {}
+
+
+def subscan_limiter_for(SUBSCAN_KEY, initial=2, rate=SUBSCAN_RATE_LIMIT):
+    # One limiter per API key per process; the first caller sets the starting window and the rate
+    key = (os.getpid(), SUBSCAN_KEY)
+    if key not in SUBSCAN_LIMITERS:
+        SUBSCAN_LIMITERS[key] = SubscanLimiter(rate, initial)
+    return SUBSCAN_LIMITERS[key]
+
+
+def subscan_outcome(status, response):
+    # 'ok', 'throttled' or 'error' for one Subscan answer
+    code = response.get("code") if isinstance(response, dict) else None
+    if status == 429 or code in SUBSCAN_RATE_LIMIT_CODES:
+        return 'throttled'
+    if status == 200 and code == 0:
+        return 'ok'
+    return 'error'
+
+
+def subscan_retry_delay(attempt):
+    return min(SUBSCAN_BACKOFF_SECONDS * 2 ** attempt, 30)
+
+
+def subscan_error(status, response):
+    if isinstance(response, dict) and 'code' in response:
+        return f"Subscan code {response.get('code')}: {response.get('message')}"
+    return f"Subscan HTTP {status}"
+
+
+def failed_lookup(hash, reason):
+    # Keeps the row through publishes_frame; insert_publishes sends it to the dead-letter table
+    return {"message": reason, "hash": hash, "from": None, "to": None}
+
+
+def fetch_subscan_transaction(session, hash, SUBSCAN_KEY, limiter):
+    # Retries rate limits and transient failures with backoff. A lookup that still fails comes back as a
+    # failed_lookup, so the row is dead-lettered instead of dropped.
+    headers = {
+        "Content-Type": "application/json",
+        "X-API-Key": SUBSCAN_KEY
+    }
+    error = None
+    errors = 0
+    for attempt in range(SUBSCAN_MAX_ATTEMPTS):
+        limiter.acquire()
+        outcome = 'error'
+        try:
+            response = session.post(SUBSCAN_TRANSACTION_URL, headers=headers, json={"hash": hash},
+                                    timeout=SUBSCAN_REQUEST_TIMEOUT_SECONDS)
+            try:
+                body = response.json()
+            except ValueError:
+                body = None
+            outcome = subscan_outcome(response.status_code, body)
+            error = subscan_error(response.status_code, body)
+        except requests.RequestException as request_error:
+            error = f"Subscan request failed: {request_error}"
+        finally:
+            limiter.release(outcome)
+
+        if outcome == 'ok':
+            return transaction_from_subscan(body)
+        if outcome == 'error':
+            errors += 1
+            if errors >= SUBSCAN_ERROR_ATTEMPTS:
+                break
+        time.sleep(subscan_retry_delay(attempt))
+
+    return failed_lookup(hash, error)
+
+
+def headers_from_rpc(block_numbers, blocks):
+    headers = {}
+    for block_number, block in zip(block_numbers, blocks):
+        if block is None:
+            raise ValueError(f"Block {block_number} header not returned by the node.")
+        headers[block_number] = (int(block['timestamp'], 16), block['hash'])
+    return headers
+
+
+class AsyncHttpClient:
+    # One aiohttp session for the async extract and enrich tasks: a keep-alive connection pool capped at
+    # per_host_limit connections per host, so hundreds of calls can be in flight without threads
+
+    def __init__(self, per_host_limit=ASYNC_CONNECTIONS_PER_HOST, timeout=ASYNC_REQUEST_TIMEOUT_SECONDS):
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0, limit_per_host=self.per_host_limit, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def rpc(self, rpc_url, method, params):
+        response = await rpc_pool_for(rpc_url).request_async(
+            self.session, {'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params})
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response['result']
+
+    async def rpc_batch(self, rpc_url, method, params_list, batch_size=RPC_BATCH_SIZE):
+        # Batches go out concurrently; results keep request order
+        batches = rpc_batch_requests(method, params_list, batch_size)
+        pool = rpc_pool_for(rpc_url)
+        responses = await asyncio.gather(*(pool.request_async(self.session, batch) for batch in batches))
+        return [result for batch, response in zip(batches, responses)
+                for result in rpc_batch_results(batch, response)]
+
+    async def subscan_transaction(self, hash, SUBSCAN_KEY):
+        # Same limiter and retry policy as fetch_subscan_transaction
+        headers = {
+            "Content-Type": "application/json",
+            "X-API-Key": SUBSCAN_KEY
+        }
+        limiter = subscan_limiter_for(SUBSCAN_KEY)
+        error = None
+        errors = 0
+        for attempt in range(SUBSCAN_MAX_ATTEMPTS):
+            await limiter.acquire_async()
+            outcome = 'error'
+            try:
+                async with self.session.post(SUBSCAN_TRANSACTION_URL, json={"hash": hash},
+                                             headers=headers) as response:
+                    try:
+                        body = await response.json(content_type=None)
+                    except ValueError:
+                        body = None
+                    outcome = subscan_outcome(response.status, body)
+                    error = subscan_error(response.status, body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as request_error:
+                error = f"Subscan request failed: {request_error!r}"
+            finally:
+                limiter.release(outcome)
+
+            if outcome == 'ok':
+                return transaction_from_subscan(body)
+            if outcome == 'error':
+                errors += 1
+                if errors >= SUBSCAN_ERROR_ATTEMPTS:
+                    break
+            await asyncio.sleep(subscan_retry_delay(attempt))
+
+        return failed_lookup(hash, error)
+
+
+class BlockHeaderCache:
+    # Block number -> (timestamp, hash). An in-memory LRU in front of a block_headers table in a local
+    # DuckDB file; misses are filled with batched eth_getBlockByNumber calls. Pass database_path=None
+    # for a memory-only cache, e.g. in backfill worker processes that can't share the file.
+
+    def __init__(self, rpc_url, database_path=CACHE_DATABASE_PATH, max_size=BLOCK_HEADER_CACHE_SIZE):
+        self.rpc_url = rpc_url
+        self.max_size = max_size
+        self.headers = OrderedDict()
+        self.con = None
+
+        if database_path is not None:
+            with CACHE_DATABASE_LOCK:
+                try:
+                    self.con = duckdb.connect(database_path)
+                except duckdb.IOException as error:
+                    # Another process holds the file lock, carry on without the persistent layer
+                    print(f"Block header cache running in memory only: {error}")
+
+                if self.con is not None:
+                    self.con.execute("""
+                        CREATE TABLE IF NOT EXISTS block_headers 
+                        (BLOCK_NUMBER BIGINT PRIMARY KEY, 
+                        BLOCK_TIMESTAMP BIGINT, 
+                        BLOCK_HASH VARCHAR(100))
+                    """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.con is not None:
+            with CACHE_DATABASE_LOCK:
+                self.con.close()
+            self.con = None
+
+    def discard_from(self, block_number):
+        # Drops headers that a reorg may have replaced
+        for cached_block in [cached for cached in self.headers if cached >= block_number]:
+            del self.headers[cached_block]
+        if self.con is not None:
+            with CACHE_DATABASE_LOCK:
+                self.con.execute("DELETE FROM block_headers WHERE BLOCK_NUMBER >= ?", [block_number])
+
+    def remember(self, block_number, header):
+        self.headers[block_number] = header
+        self.headers.move_to_end(block_number)
+        if len(self.headers) > self.max_size:
+            self.headers.popitem(last=False)
+
+    def lookup(self, block_numbers):
+        # Returns the cached headers and the block numbers that still have to be fetched
+        found = {}
+        missing = []
+        for block_number in set(block_numbers):
+            header = self.headers.get(block_number)
+            if header is None:
+                missing.append(block_number)
+            else:
+                self.headers.move_to_end(block_number)
+                found[block_number] = header
+
+        if missing and self.con is not None:
+            wanted = pl.DataFrame({"BLOCK_NUMBER": missing}, schema={"BLOCK_NUMBER": pl.Int64})
+            with CACHE_DATABASE_LOCK:
+                self.con.register('wanted_blocks', wanted)
+                stored = self.con.execute("""
+                    SELECT h.BLOCK_NUMBER, h.BLOCK_TIMESTAMP, h.BLOCK_HASH 
+                    FROM block_headers h 
+                    JOIN wanted_blocks w USING (BLOCK_NUMBER)
+                """).fetchall()
+                self.con.unregister('wanted_blocks')
+
+            for block_number, timestamp, block_hash in stored:
+                found[block_number] = (timestamp, block_hash)
+                self.remember(block_number, (timestamp, block_hash))
+            missing = [block_number for block_number in missing if block_number not in found]
+
+        return found, missing
+
+    def store(self, fetched):
+        if fetched and self.con is not None:
+            fetched_blocks = pl.DataFrame({
+                "BLOCK_NUMBER": list(fetched.keys()),
+                "BLOCK_TIMESTAMP": [header[0] for header in fetched.values()],
+                "BLOCK_HASH": [header[1] for header in fetched.values()]
+            }, schema={"BLOCK_NUMBER": pl.Int64, "BLOCK_TIMESTAMP": pl.Int64, "BLOCK_HASH": pl.Utf8})
+            with CACHE_DATABASE_LOCK:
+                self.con.register('fetched_blocks', fetched_blocks)
+                self.con.execute("INSERT OR IGNORE INTO block_headers SELECT * FROM fetched_blocks")
+                self.con.unregister('fetched_blocks')
+
+        for block_number, header in fetched.items():
+            self.remember(block_number, header)
+
+    def get_many(self, block_numbers):
+        found, missing = self.lookup(block_numbers)
+
+        if missing:
+            blocks = rpc_batch(self.rpc_url, 'eth_getBlockByNumber', [[hex(number), False] for number in missing])
+            fetched = headers_from_rpc(missing, blocks)
+            self.store(fetched)
+            found.update(fetched)
+
+        return found
+
+    def to_frame(self, block_numbers):
+        return headers_frame(self.get_many(block_numbers))
+
+
+class TransactionCache:
+    # Transaction hash -> sender and recipient, which never change once mined. Kept in a transactions table
+    # next to the block headers and trimmed to the max_size most recently used hashes. With database_path=None
+    # it only remembers lookups made through this instance.
+
+    def __init__(self, database_path=CACHE_DATABASE_PATH, max_size=TRANSACTION_CACHE_SIZE):
+        self.max_size = max_size
+        self.memory = {}
+        self.con = None
+
+        if database_path is not None:
+            with CACHE_DATABASE_LOCK:
+                try:
+                    self.con = duckdb.connect(database_path)
+                except duckdb.IOException as error:
+                    print(f"Transaction cache running in memory only: {error}")
+
+                if self.con is not None:
+                    self.con.execute("""
+                        CREATE TABLE IF NOT EXISTS transactions 
+                        (TRANSACTION_HASH VARCHAR(100) PRIMARY KEY, 
+                        MESSAGE VARCHAR(100), 
+                        FROM_ADDRESS VARCHAR(100), 
+                        TO_ADDRESS VARCHAR(100), 
+                        LAST_USED TIMESTAMP)
+                    """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.con is not None:
+            with CACHE_DATABASE_LOCK:
+                self.con.close()
+            self.con = None
+
+    def lookup(self, hashes):
+        # Returns the cached transactions by hash and the distinct hashes that still have to be fetched
+        found = {}
+        missing = []
+        for hash in dict.fromkeys(hashes):
+            if hash in self.memory:
+                found[hash] = self.memory[hash]
+            else:
+                missing.append(hash)
+
+        if missing and self.con is not None:
+            wanted = pl.DataFrame({"TRANSACTION_HASH": missing}, schema={"TRANSACTION_HASH": pl.Utf8})
+            with CACHE_DATABASE_LOCK:
+                self.con.register('wanted_transactions', wanted)
+                stored = self.con.execute("""
+                    SELECT t.TRANSACTION_HASH, t.MESSAGE, t.FROM_ADDRESS, t.TO_ADDRESS 
+                    FROM transactions t 
+                    JOIN wanted_transactions w USING (TRANSACTION_HASH)
+                """).fetchall()
+                if stored:
+                    # Hits count as uses, so eviction drops the least recently used hashes
+                    self.con.execute("""
+                        UPDATE transactions 
+                        SET LAST_USED = ? 
+                        WHERE TRANSACTION_HASH IN (SELECT TRANSACTION_HASH FROM wanted_transactions)
+                    """, [datetime.datetime.utcnow()])
+                self.con.unregister('wanted_transactions')
+
+            for hash, message, from_address, to_address in stored:
+                found[hash] = {"message": message, "hash": hash, "from": from_address, "to": to_address}
+            missing = [hash for hash in missing if hash not in found]
+
+        return found, missing
+
+    def store(self, transactions):
+        # Only successful lookups are cached; a failed one is retried next time
+        transactions = [transaction for transaction in transactions
+                        if transaction is not None and transaction["message"] == "Success"]
+        for transaction in transactions:
+            self.memory[transaction["hash"]] = transaction
+
+        if transactions and self.con is not None:
+            now = datetime.datetime.utcnow()
+            fetched_transactions = pl.DataFrame({
+                "TRANSACTION_HASH": [transaction["hash"] for transaction in transactions],
+                "MESSAGE": [transaction["message"] for transaction in transactions],
+                "FROM_ADDRESS": [transaction["from"] for transaction in transactions],
+                "TO_ADDRESS": [transaction["to"] for transaction in transactions],
+                "LAST_USED": [now] * len(transactions)
+            }, schema={"TRANSACTION_HASH": pl.Utf8, "MESSAGE": pl.Utf8, "FROM_ADDRESS": pl.Utf8,
+                       "TO_ADDRESS": pl.Utf8, "LAST_USED": pl.Datetime})
+            with CACHE_DATABASE_LOCK:
+                self.con.register('fetched_transactions', fetched_transactions)
+                self.con.execute("INSERT OR REPLACE INTO transactions SELECT * FROM fetched_transactions")
+                self.con.unregister('fetched_transactions')
+                self.evict()
+
+    def evict(self):
+        # Called from store with CACHE_DATABASE_LOCK held
+        cached = self.con.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        if cached > self.max_size:
+            self.con.execute("""
+                DELETE FROM transactions 
+                WHERE TRANSACTION_HASH IN (
+                    SELECT TRANSACTION_HASH FROM transactions ORDER BY LAST_USED LIMIT ?)
+            """, [cached - self.max_size])
+
+
+def headers_frame(headers):
+    return pl.DataFrame({
+        "BLOCK_NUMBER": list(headers.keys()),
+        "BLOCK_TIMESTAMP": [header[0] for header in headers.values()],
+        "HEADER_BLOCK_HASH": [header[1] for header in headers.values()]
+    }, schema={"BLOCK_NUMBER": pl.Int64, "BLOCK_TIMESTAMP": pl.Int64, "HEADER_BLOCK_HASH": pl.Utf8})
+
+
+def create_pipeline_tables(con):
+    create_publishes_table(con)
 
-    con.execute("""
-            CREATE TABLE IF NOT EXISTS publishes 
-            (MESSAGE VARCHAR(100), 
-            ASSET_ID VARCHAR(100), 
-            BLOCK_NUMBER INTEGER, 
-            TIME_ASSET_CREATED TIMESTAMP, 
-            TIME_OF_TRANSACTION TIMESTAMP, 
-            TRAC_PRICE FLOAT, 
-            EPOCHS_NUMBER INTEGER, 
-            EPOCH_LENGTH_DAYS FLOAT, 
-            PUBLISHER_ADDRESS VARCHAR(100), 
-            SENT_ADDRESS VARCHAR(100), 
-            TRANSACTION_HASH VARCHAR(100) PRIMARY KEY, 
-            BLOCK_HASH VARCHAR(100))
-        """)
+    create_dead_letter_table(con)
 
-    database_block = con.execute("""
-        SELECT MAX(BLOCK_NUMBER) 
-        AS max_block 
-        FROM publishes
-    """).fetchone()
+    create_service_agreement_event_tables(con)
+
+    create_ingestion_state_table(con)
+
+    create_recent_blocks_table(con)
+
+
+def plan_extract_range(con, rpc_url, stream, block_number, confirmation_depth, block_headers=None,
+                       header_cache_path=CACHE_DATABASE_PATH, create_tables=True):
+    # Creates the tables, undoes any reorg since the last run and returns the (from_block, latest_block)
+    # range to ingest next. Long-running callers create the tables once up front and pass create_tables=False.
+    if create_tables:
+        create_pipeline_tables(con)
+
+    cursor = read_ingestion_cursor(con, stream)
+
+    # Only blocks with enough confirmations are ingested
+    latest_block = block_number - confirmation_depth
+    last_block_500 = block_number - 500
+
+    if cursor is not None and cursor['block_hash'] is not None and cursor['block_number'] < latest_block:
+        fork_block = find_reorg_block(con, rpc_url, stream, cursor)
+        if fork_block is not None:
+            rewind_stream(con, stream, fork_block)
+            if block_headers is not None:
+                block_headers.discard_from(fork_block)
+            else:
+                with BlockHeaderCache(rpc_url, header_cache_path) as block_headers:
+                    block_headers.discard_from(fork_block)
+            cursor = read_ingestion_cursor(con, stream)
 
-    if database_block[0] is not None:
-        max_block_number = (database_block[0]) - 1
-        print(f"The maximum block number in the database is: {max_block_number + 1}")
+    if cursor is not None:
+        # Resume right after the last fully processed block
+        from_block = cursor['block_number'] + 1
+        print(f"Resuming after block {cursor['block_number']} (run {cursor['run_id']}).")
+    elif stream != SERVICE_AGREEMENT_STREAM:
+        # Publishes is shared by every contract of the network, so its rows say nothing about a new stream;
+        # history before the last 500 blocks is the backfill's job
+        from_block = last_block_500
+        print(f"No cursor for {stream} yet, starting 500 blocks back.")
     else:
-        max_block_number = 0
-        print("Couldn't retrieve the maximum block number.")
+        # No cursor yet for the stream that filled publishes before cursors existed: bootstrap once from the
+        # table itself
+        database_block = con.execute(f"""
+            SELECT MAX(BLOCK_NUMBER) 
+            AS max_block 
+            FROM {publishes_table()}
+        """).fetchone()
 
-    print(f"The latest block number is: {w3.eth.block_number}")
+        if database_block[0] is not None and (database_block[0] - 1) > last_block_500:
+            from_block = database_block[0] - 1
+            print(f"The maximum block number in the database is: {database_block[0]}")
+        else:
+            # Fetch past 500 blocks
+            from_block = last_block_500
+            print("Couldn't retrieve the maximum block number.")
 
-    latest_block = w3.eth.block_number - 1
-    last_block_500 = w3.eth.block_number - 500
+    return from_block, latest_block
 
-    # Contract address and initialization
-    contract_address = '0xB20F6F3B9176D4B284bA26b80833ff5bFe6db28F'
-    contract = w3.eth.contract(address=contract_address, abi=serviceAgreementABI)
 
-    if (max_block_number > last_block_500) and database_block[0] is not None:
-        # Fetch past ServiceAgreementV1Created events
-        events_list = contract.events.ServiceAgreementV1Created.get_logs(
-            fromBlock=max_block_number,
-            toBlock=latest_block
-        )
+def build_cursor(stream, latest_block, recent_blocks, lifecycle_events=None, contract_address=CONTRACT_ADDRESS,
+                 event_name=SERVICE_AGREEMENT_EVENT_NAME, run_id=None):
+    # Saved by load_to_motherduck together with the rows it covers, lifecycle events included. Callers outside
+    # a Prefect flow run pass their own run_id.
+    return {
+        'stream': stream,
+        'contract_address': contract_address,
+        'event_name': event_name,
+        'block_number': latest_block,
+        'block_hash': recent_blocks[-1][1],
+        'recent_blocks': recent_blocks,
+        'lifecycle_events': lifecycle_events,
+        'run_id': run_id or current_run_id()
+    }
+
+
+def save_empty_range(con, cursor, from_block):
+    # No publishes to load, move the cursor past the range
+    con.begin()
+    try:
+        insert_lifecycle_events(con, cursor.get('lifecycle_events'))
+        save_ingestion_cursor(con, cursor)
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    print(f"No publishes found for blocks {from_block}-{cursor['block_number']}.")
+
 
+def extract_block_range(con, w3, rpc_url, stream, from_block, latest_block, raw_logs=True, serviceAgreementABI=None,
+                        run_id=None):
+    lifecycle_events = None
+    if raw_logs:
+        # Raw eth_getLogs on the precomputed topics, decoded without building a web3 contract
+        processed_events, lifecycle_events = decode_service_agreement_logs(
+            iter_service_agreement_logs(w3, from_block, latest_block))
     else:
-        # Fetch past 500 ServiceAgreementV1Created events
-        events_list = contract.events.ServiceAgreementV1Created.get_logs(
-            fromBlock=last_block_500,
-            toBlock=latest_block
+        # Reference path through web3's event processing, publishes only
+        # Contract initialization
+        contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=serviceAgreementABI)
+
+        # Fetch past ServiceAgreementV1Created events in provider-sized chunks
+        events_list = iter_logs_chunked(
+            lambda start, end: contract.events.ServiceAgreementV1Created.get_logs(fromBlock=start, toBlock=end),
+            from_block,
+            latest_block
         )
+        processed_events = process_service_agreement_events(events_list)
 
-    # TEST!!
-    # Use to test the script Comment out when running in production
-    events_list = contract.events.ServiceAgreementV1Created.get_logs(
-        fromBlock=last_block_500 + 480,
-        toBlock=latest_block
-    )
+    # Hashes of the range's last blocks, kept to detect a reorg on the next run
+    recent_blocks = fetch_block_headers(rpc_url, list(range(max(from_block, latest_block - REORG_WINDOW + 1),
+                                                            latest_block + 1)))
 
-    if len(events_list) > 0:
-        processed_events = [{
-            'assetContract': item['args'].get('assetContract', ''),
-            'startTime': item['args'].get('startTime', ''),
-            'epochsNumber': item['args'].get('epochsNumber', ''),
-            'epochLength': item['args'].get('epochLength', ''),
-            'tokenAmount': item['args'].get('tokenAmount', ''),
-            'event': item.get('event', ''),
-            'tokenId': item['args'].get('tokenId', ''),
-            'transactionHash': item.get('transactionHash', '').hex() if item.get('transactionHash') else '',
-            'blockHash': item.get('blockHash', '').hex() if item.get('blockHash') else '',
-            'blockNumber': item.get('blockNumber', ''),
-            'address': item.get('address', '')
-        } for item in events_list]
-    else:
-        raise ValueError("No events found for the specified blocks.")
+    cursor = build_cursor(stream, latest_block, recent_blocks, lifecycle_events, run_id=run_id)
 
-    return processed_events
+    if len(processed_events) == 0:
+        save_empty_range(con, cursor, from_block)
 
-@task(log_prints=True, retries=3, retry_delay_seconds=5, tags=['create-dataframe'])
-def create_dataframe(processed_events, SUBSCAN_KEY, MAX_WORKERS):
-    # Create DataFrame using polars
-    df_assets = (
-        pl.DataFrame(processed_events)
-        .with_columns([
-            (pl.col("tokenAmount") / 1e18).alias("tokenAmount"),
-            (pl.col("epochLength") / 86400).alias("epochLength"),
-            pl.col("startTime").apply(lambda y: datetime.datetime.utcfromtimestamp(y).isoformat()).alias("startTime")
-        ])
+    return processed_events, cursor
+
+
+@task(log_prints=True, retries=3, retry_delay_seconds=5, tags=['extract-events'])
+def extract_events(con, serviceAgreementABI, ONFINALITY_KEY, raw_logs=True, confirmation_depth=CONFIRMATION_DEPTH):
+    # Connect to the Ethereum node using Websockets
+    rpc_url = onfinality_rpc_url(ONFINALITY_KEY)
+    w3 = Web3(PooledRpcProvider(rpc_url))
+
+    block_number = w3.eth.block_number
+    print(f"The latest block number is: {block_number}")
+
+    from_block, latest_block = plan_extract_range(con, rpc_url, SERVICE_AGREEMENT_STREAM, block_number,
+                                                  confirmation_depth)
+
+    if from_block > latest_block:
+        print(f"No confirmed blocks after {from_block - 1} yet.")
+        return [], None
+
+    checkpoint = reuse_extract_checkpoint(rpc_url, SERVICE_AGREEMENT_STREAM, from_block)
+    if checkpoint is not None:
+        return checkpoint
+
+    processed_events, cursor = extract_block_range(con, w3, rpc_url, SERVICE_AGREEMENT_STREAM, from_block,
+                                                   latest_block, raw_logs, serviceAgreementABI)
+
+    if len(processed_events) > 0:
+        save_extract_checkpoint(stage_checkpoint_dir(SERVICE_AGREEMENT_STREAM, from_block, latest_block),
+                                processed_events, cursor)
+
+    return processed_events, cursor
+
+
+def stage_checkpoint_dir(stream, from_block, latest_block):
+    return os.path.join(STAGE_CHECKPOINT_DIR, CODE_VERSION, stream.replace(':', '_'), f'{from_block}-{latest_block}')
+
+
+def find_stage_checkpoint(stream, from_block):
+    # A finished extract for a range starting at from_block. The chain has usually moved on since, so the
+    # range may end before today's latest block; the next run picks up the rest.
+    candidates = [directory for directory in glob.glob(stage_checkpoint_dir(stream, from_block, '*'))
+                  if os.path.exists(os.path.join(directory, 'cursor.json'))]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda directory: int(directory.rsplit('-', 1)[1]))
+
+
+def write_atomically(path, write):
+    # Readers only ever see complete files
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f'{path}.tmp'
+    write(temporary_path)
+    os.replace(temporary_path, path)
+
+
+def save_extract_checkpoint(checkpoint_dir, processed_events, cursor):
+    cursor['checkpoint'] = checkpoint_dir
+    write_atomically(os.path.join(checkpoint_dir, 'extract.parquet'), processed_events.write_parquet)
+
+    # The cursor is written last and marks the checkpoint as complete
+    def write_cursor(path):
+        with open(path, 'w') as file:
+            json.dump(cursor, file)
+    write_atomically(os.path.join(checkpoint_dir, 'cursor.json'), write_cursor)
+
+
+def load_extract_checkpoint(checkpoint_dir):
+    with open(os.path.join(checkpoint_dir, 'cursor.json'), 'r') as file:
+        cursor = json.load(file)
+    return pl.read_parquet(os.path.join(checkpoint_dir, 'extract.parquet')), cursor
+
+
+def clear_stage_checkpoint(checkpoint_dir):
+    # Called once the range is loaded; also drops the stream and version folders when they run empty
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    for parent in (os.path.dirname(checkpoint_dir), os.path.dirname(os.path.dirname(checkpoint_dir))):
+        try:
+            os.rmdir(parent)
+        except OSError:
+            break
+
+
+def prune_stage_checkpoints(stream, from_block):
+    # Runs always start right after the cursor, so only a range starting at from_block can be reused. Ranges
+    # of the stream starting anywhere else, and whole folders of other code versions, are dropped.
+    for version_dir in glob.glob(os.path.join(STAGE_CHECKPOINT_DIR, '*')):
+        if os.path.basename(version_dir) != CODE_VERSION:
+            shutil.rmtree(version_dir, ignore_errors=True)
+
+    for checkpoint_dir in glob.glob(stage_checkpoint_dir(stream, '*', '*')):
+        if os.path.basename(checkpoint_dir).split('-', 1)[0] != str(from_block):
+            clear_stage_checkpoint(checkpoint_dir)
+
+
+def reuse_extract_checkpoint(rpc_url, stream, from_block):
+    # The saved range is reused as long as its last block is still canonical
+    prune_stage_checkpoints(stream, from_block)
+    checkpoint_dir = find_stage_checkpoint(stream, from_block)
+    if checkpoint_dir is None:
+        return None
+
+    processed_events, cursor = load_extract_checkpoint(checkpoint_dir)
+    _, canonical_hash, _ = fetch_block_headers(rpc_url, [cursor['block_number']])[0]
+    if canonical_hash != cursor['block_hash']:
+        print(f"Discarding the extract checkpoint for blocks {from_block}-{cursor['block_number']}, "
+              f"block {cursor['block_number']} was reorganized.")
+        clear_stage_checkpoint(checkpoint_dir)
+        return None
+
+    print(f"Reusing extracted events for blocks {from_block}-{cursor['block_number']} from {checkpoint_dir}.")
+    return processed_events, cursor
+
+
+def assets_frame(processed_events):
+    # Column expressions over the typed event frame, no per-row Python. tokenAmount is already in TRAC.
+    return (
+        processed_events
         .select([
             pl.col("assetContract").alias("ASSET_CONTRACT"),
             pl.col("startTime").alias("TIME_ASSET_CREATED"),
             pl.col("epochsNumber").alias("EPOCHS_NUMBER"),
-            pl.col("epochLength").alias("EPOCH_LENGTH-(DAYS)"),
+            (pl.col("epochLength") / 86400).alias("EPOCH_LENGTH-(DAYS)"),
             pl.col("tokenAmount").alias("TRAC_PRICE"),
             pl.col("event").alias("EVENT"),
-            pl.col("tokenId").alias("ASSET_ID"),
+            pl.col("tokenId").cast(pl.Utf8).alias("ASSET_ID"),
             pl.col("transactionHash").alias("TRANSACTION_HASH"),
             pl.col("blockHash").alias("BLOCK_HASH"),
             pl.col("blockNumber").alias("BLOCK_NUMBER"),
             pl.col("address").alias("EVENT_CONTRACT_ADDRESS")
         ]))
 
-    # Get all transaction hashes
-    hashes = df_assets['TRANSACTION_HASH'].to_list()
-
-    def fetch_transaction_data(hash):
-        subscan_url = "https://origintrail.api.subscan.io/api/scan/evm/transaction"
-        headers = {
-            "Content-Type": "application/json",
-            "X-API-Key": SUBSCAN_KEY
-        }
-        data = {
-            "hash": hash
-        }
-        response = requests.post(subscan_url, headers=headers, json=data).json()
-        if response.get("code") == 0:
-            data = response["data"]
-            return {
-                "message": response["message"],
-                "generated_at": response["generated_at"],
-                "hash": data["hash"],
-                "from": data["from"],
-                "to": data["to"]["address"]
-            }
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        hash_list = list(executor.map(fetch_transaction_data, hashes))
 
+def transactions_frame(hash_list):
     # Filter out any None values from the hash_list
     hash_list = [h for h in hash_list if h is not None]
 
-    df_hash = (
-        pl.DataFrame(hash_list)
-        .with_columns(
-            pl.col("generated_at")
-            .apply(lambda y: datetime.datetime.utcfromtimestamp(y).isoformat()).alias("generated_at")
-        )
+    return (
+        pl.DataFrame(hash_list, schema={"message": pl.Utf8, "hash": pl.Utf8, "from": pl.Utf8, "to": pl.Utf8})
         .select([
             pl.col("message").alias("MESSAGE"),
-            pl.col("generated_at").alias("TIME_OF_TRANSACTION"),
             pl.col("hash").alias("TRANSACTION_HASH"),
             pl.col("from").alias("PUBLISHER_ADDRESS"),
             pl.col("to").alias("SENT_ADDRESS")
         ]))
 
-    df = df_assets.join(df_hash, on="TRANSACTION_HASH", how="left")
 
-    # Filter rows based on the MESSAGE column
-    df = df.filter(pl.col("MESSAGE") == "Success")
+def publishes_frame(df_assets, hash_list, headers):
+    df_hash = transactions_frame(hash_list)
+
+    df_blocks = (
+        headers_frame(headers)
+        .select([
+            pl.col("BLOCK_NUMBER"),
+            pl.from_epoch("BLOCK_TIMESTAMP", time_unit="s").alias("TIME_OF_TRANSACTION")
+        ]))
+
+    df = (
+        df_assets
+        .join(df_hash, on="TRANSACTION_HASH", how="left")
+        .join(df_blocks, on="BLOCK_NUMBER", how="left"))
+
+    # Rows with a failed lookup stay in; insert_publishes dead-letters them
+    df = df.select(PUBLISHES_COLUMNS)
+
+    return df
+
+
+@task(log_prints=True, retries=3, retry_delay_seconds=5, tags=['create-dataframe'])
+def create_dataframe(processed_events, SUBSCAN_KEY, MAX_WORKERS, enrichment_source='subscan', rpc_url=None,
+                     header_cache_path=CACHE_DATABASE_PATH, block_headers=None, checkpoint_dir=None):
+    transform_path = os.path.join(checkpoint_dir, 'transform.parquet') if checkpoint_dir else None
+    if transform_path is not None and os.path.exists(transform_path):
+        print(f"Reusing the enriched DataFrame from {checkpoint_dir}.")
+        return pl.read_parquet(transform_path)
+
+    # Get all transaction hashes
+    hashes = processed_events['transactionHash'].to_list()
+
+    hash_list = enrich_transactions(hashes, SUBSCAN_KEY, MAX_WORKERS, enrichment_source, rpc_url, header_cache_path)
+
+    # Block timestamps, one header lookup per distinct block; long-running callers pass their own open cache
+    header_cache = BlockHeaderCache(rpc_url, header_cache_path) if block_headers is None else nullcontext(block_headers)
+    with header_cache as block_headers:
+        headers = block_headers.get_many(processed_events['blockNumber'].unique().to_list())
 
-    df = df.select(["MESSAGE",
-                    "ASSET_ID",
-                    "BLOCK_NUMBER",
-                    "TIME_ASSET_CREATED",
-                    "TIME_OF_TRANSACTION",
-                    "TRAC_PRICE",
-                    "EPOCHS_NUMBER",
-                    "EPOCH_LENGTH-(DAYS)",
-                    "PUBLISHER_ADDRESS",
-                    "SENT_ADDRESS",
-                    "TRANSACTION_HASH",
-                    "BLOCK_HASH"])
+    if TRANSFORM_MODE == 'sql':
+        return staged_batch(processed_events, hash_list, headers)
+
+    df = publishes_frame(assets_frame(processed_events), hash_list, headers)
+
+    if transform_path is not None:
+        write_atomically(transform_path, df.write_parquet)
 
     return df
 
 
+def enrich_transactions(hashes, SUBSCAN_KEY, MAX_WORKERS, enrichment_source, rpc_url, header_cache_path):
+    # Sender and recipient of every transaction, from the cache or else the enrichment source. Failed lookups
+    # come back as failed_lookup entries.
+
+    # MAX_WORKERS is only the starting concurrency, the shared limiter adapts it to what the key allows
+    limiter = subscan_limiter_for(SUBSCAN_KEY, MAX_WORKERS)
+    session = requests.Session()
+    session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=SUBSCAN_CONCURRENCY_MAX))
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=SUBSCAN_CONCURRENCY_MAX))
+
+    def fetch_transaction_data(hash):
+        return fetch_subscan_transaction(session, hash, SUBSCAN_KEY, limiter)
+
+    with TransactionCache(header_cache_path) as transaction_cache:
+        # Only hashes never seen before go to the network, so retries and overlapping ranges cost no calls
+        cached, missing = transaction_cache.lookup(hashes)
+
+        if enrichment_source == 'rpc':
+            # Batched eth_getTransactionByHash against the node extract_events reads from
+            fetched = fetch_transactions_rpc(missing, rpc_url)
+        else:
+            with ThreadPoolExecutor(max_workers=SUBSCAN_CONCURRENCY_MAX) as executor:
+                fetched = list(executor.map(fetch_transaction_data, missing))
+            print(f"Subscan: {limiter.requests} requests, {limiter.throttled} rate limited, {limiter.errors} failed, "
+                  f"window {limiter.window:.1f}.")
+
+        transaction_cache.store(fetched)
+
+    print(f"Transactions: {len(cached)} cached, {len(missing)} fetched.")
+    return list(cached.values()) + fetched
+
+
+@task(log_prints=True, retries=3, retry_delay_seconds=5, tags=['extract-events'])
+async def extract_events_async(con, ONFINALITY_KEY, confirmation_depth=CONFIRMATION_DEPTH):
+    # Prefect runs async tasks on their own event loop, so each task opens its own client session
+    async with AsyncHttpClient() as client:
+        return await extract_new_events_async(con, client, onfinality_rpc_url(ONFINALITY_KEY), confirmation_depth)
+
+
+async def extract_new_events_async(con, client, rpc_url, confirmation_depth, stream=SERVICE_AGREEMENT_STREAM,
+                                   contract_address=CONTRACT_ADDRESS, topics=SERVICE_AGREEMENT_TOPICS,
+                                   header_cache_path=CACHE_DATABASE_PATH, database_lock=None,
+                                   event_name=SERVICE_AGREEMENT_EVENT_NAME):
+
+    block_number = int(await client.rpc(rpc_url, 'eth_blockNumber', []), 16)
+    print(f"The latest block number is: {block_number}")
+
+    # The reorg check does blocking RPC and DuckDB work, so it runs off the event loop other sources share.
+    # database_lock keeps sources on one database from writing at the same time.
+    async with database_lock or nullcontext():
+        from_block, latest_block = await asyncio.to_thread(plan_extract_range, con, rpc_url, stream, block_number,
+                                                           confirmation_depth, header_cache_path=header_cache_path)
+
+    if from_block > latest_block:
+        print(f"No confirmed blocks after {from_block - 1} yet.")
+        return [], None
+
+    def get_logs(start, end):
+        return client.rpc(rpc_url, 'eth_getLogs', [{
+            'address': contract_address,
+            'topics': topics,
+            'fromBlock': hex(start),
+            'toBlock': hex(end)
+        }])
+
+    # The log walk and the header fetch for the reorg window run concurrently
+    window = list(range(max(from_block, latest_block - REORG_WINDOW + 1), latest_block + 1))
+    logs, blocks = await asyncio.gather(
+        fetch_logs_chunked_async(get_logs, from_block, latest_block),
+        client.rpc_batch(rpc_url, 'eth_getBlockByNumber', [[hex(number), False] for number in window])
+    )
+
+    processed_events, lifecycle_events = decode_service_agreement_logs(logs)
+    recent_blocks = [(number, block['hash'], block['parentHash']) if block is not None else (number, None, None)
+                     for number, block in zip(window, blocks)]
+    cursor = build_cursor(stream, latest_block, recent_blocks, lifecycle_events, contract_address, event_name)
+
+    if len(processed_events) == 0:
+        async with database_lock or nullcontext():
+            await asyncio.to_thread(save_empty_range, con, cursor, from_block)
+
+    return processed_events, cursor
+
+
+@task(log_prints=True, retries=3, retry_delay_seconds=5, tags=['create-dataframe'])
+async def create_dataframe_async(processed_events, SUBSCAN_KEY, enrichment_source='rpc', rpc_url=None,
+                                 header_cache_path=CACHE_DATABASE_PATH):
+    async with AsyncHttpClient() as client:
+        return await enrich_events_async(processed_events, client, SUBSCAN_KEY, enrichment_source, rpc_url,
+                                         header_cache_path)
+
+
+async def enrich_events_async(processed_events, client, SUBSCAN_KEY, enrichment_source, rpc_url, header_cache_path):
+    # Get all transaction hashes
+    hashes = processed_events['transactionHash'].to_list()
+
+    # The caches are local DuckDB files, so opening, reading, writing and closing them runs in a thread and the
+    # event loop keeps serving the other sources
+    def open_caches():
+        return BlockHeaderCache(rpc_url, header_cache_path), TransactionCache(header_cache_path)
+
+    def lookup_caches():
+        return (transaction_cache.lookup(hashes),
+                block_headers.lookup(processed_events['blockNumber'].unique().to_list()))
+
+    def store_caches():
+        transaction_cache.store(fetched_transactions)
+        block_headers.store(fetched)
+
+    def close_caches():
+        transaction_cache.close()
+        block_headers.close()
+
+    block_headers, transaction_cache = await asyncio.to_thread(open_caches)
+    try:
+        (cached, missing_hashes), (headers, missing) = await asyncio.to_thread(lookup_caches)
+        if enrichment_source == 'rpc':
+            transactions = client.rpc_batch(rpc_url, 'eth_getTransactionByHash', [[hash] for hash in missing_hashes])
+        else:
+            transactions = asyncio.gather(*(client.subscan_transaction(hash, SUBSCAN_KEY) for hash in missing_hashes))
+
+        # Enrichment and missing block headers are fetched concurrently
+        fetched_transactions, blocks = await asyncio.gather(
+            transactions,
+            client.rpc_batch(rpc_url, 'eth_getBlockByNumber', [[hex(number), False] for number in missing])
+        )
+
+        if enrichment_source == 'rpc':
+            fetched_transactions = transactions_from_rpc(missing_hashes, fetched_transactions)
+        fetched = headers_from_rpc(missing, blocks)
+        await asyncio.to_thread(store_caches)
+        headers.update(fetched)
+    finally:
+        await asyncio.to_thread(close_caches)
+
+    print(f"Transactions: {len(cached)} cached, {len(missing_hashes)} fetched.")
+    hash_list = list(cached.values()) + fetched_transactions
+
+    if TRANSFORM_MODE == 'sql':
+        return staged_batch(processed_events, hash_list, headers)
+
+    return publishes_frame(assets_frame(processed_events), hash_list, headers)
+
+
 @task(log_prints=True, retries=3, tags=['load-to-motherduck'])
-def load_to_motherduck(df, con):
+def load_to_motherduck(df, con, cursor=None):
 
-    con.register('df', df)
+    # Rows and the ingestion cursor are committed together. Landing files are written before the commit and
+    # removed again on rollback.
+    landing_files = []
+    con.begin()
+    try:
+        inserted, dead_lettered, landing_files = insert_batch(
+            con, df, landing=(cursor['stream'] if cursor is not None else 'batch', None))
+        if cursor is not None:
+            insert_lifecycle_events(con, cursor.get('lifecycle_events'))
+            save_ingestion_cursor(con, cursor)
+        con.commit()
+    except Exception:
+        con.rollback()
+        remove_landing_files(landing_files)
+        raise
+    compact_landing_files(landing_files)
 
-    con.sql("""
-        INSERT INTO publishes
-        SELECT * FROM df
-        ON CONFLICT (TRANSACTION_HASH)  -- this is the primary key
-        DO NOTHING;
-    """)
+    # The range is in the database now, its stage outputs are no longer needed
+    if cursor is not None and cursor.get('checkpoint'):
+        clear_stage_checkpoint(cursor['checkpoint'])
+
+    print(f"Inserted {inserted} rows.")
+    if dead_lettered:
+        print(f"{dead_lettered} rows failed enrichment and went to the dead-letter table.")
+
+
+@task(log_prints=True, retries=3, retry_delay_seconds=5, tags=['dead-letters'])
+def drain_dead_letters(con, SUBSCAN_KEY, MAX_WORKERS, enrichment_source='subscan', rpc_url=None,
+                       header_cache_path=CACHE_DATABASE_PATH, limit=DEAD_LETTER_BATCH_SIZE):
+    # Re-enriches only the dead-lettered hashes whose backoff has passed; the rest of the rows are reused as is
+    create_dead_letter_table(con)
+
+    df_due = con.execute("""
+        SELECT * FROM enrichment_dead_letters 
+        WHERE NEXT_ATTEMPT_AT <= ? AND ATTEMPTS < ? 
+        ORDER BY NEXT_ATTEMPT_AT 
+        LIMIT ?
+    """, [datetime.datetime.utcnow(), DEAD_LETTER_MAX_ATTEMPTS, limit]).pl()
+
+    if df_due.height == 0:
+        print("No dead-lettered transactions are due.")
+        return 0
+
+    hash_list = enrich_transactions(df_due['TRANSACTION_HASH'].to_list(), SUBSCAN_KEY, MAX_WORKERS,
+                                    enrichment_source, rpc_url, header_cache_path)
+
+    df = (
+        df_due
+        .rename({"EPOCH_LENGTH_DAYS": "EPOCH_LENGTH-(DAYS)"})
+        .join(transactions_frame(hash_list), on="TRANSACTION_HASH", how="left")
+        .select(PUBLISHES_COLUMNS))
+
+    # Recovered rows land under a name derived from their hashes, so a retried drain overwrites its own files
+    landing_key = hashlib.sha256(''.join(sorted(df_due['TRANSACTION_HASH'].to_list())).encode()).hexdigest()[:16]
+    landing_files = []
+    con.begin()
+    try:
+        recovered, failed, landing_files = insert_publishes(con, df, landing=('recovered', landing_key))
+        con.commit()
+    except Exception:
+        con.rollback()
+        remove_landing_files(landing_files)
+        raise
+    compact_landing_files(landing_files)
+
+    print(f"Dead letters: {recovered} recovered, {failed} failed again.")
+    return recovered
+
+
+def find_deploy_block(w3, address, latest_block):
+    # Binary search for the first block with contract code at the address (needs an archive node)
+    low, high = 0, latest_block
+    while low < high:
+        mid = (low + high) // 2
+        if len(w3.eth.get_code(address, block_identifier=mid)) > 0:
+            high = mid
+        else:
+            low = mid + 1
+    return low
+
+
+def plan_backfill_shards(start_block, end_block, shard_size):
+    # Shards are aligned to multiples of shard_size so reruns produce the same boundaries
+    first_shard = start_block - start_block % shard_size
+    return [(max(shard, start_block), min(shard + shard_size - 1, end_block))
+            for shard in range(first_shard, end_block + 1, shard_size)]
+
+
+def backfill_shard(shard_start, shard_end, ONFINALITY_KEY, SUBSCAN_KEY, MAX_WORKERS, ENRICHMENT_SOURCE, processes=1):
+    # Runs in a worker process. The batch goes back to the parent, which owns the database connection, as
+    # Arrow: Polars cannot pickle the decimal TRAC columns.
+    w3 = Web3(PooledRpcProvider(onfinality_rpc_url(ONFINALITY_KEY)))
+
+    # Each worker process gets its share of the Subscan rate limit
+    subscan_limiter_for(SUBSCAN_KEY, MAX_WORKERS, SUBSCAN_RATE_LIMIT / processes)
+
+    processed_events, lifecycle_events = decode_service_agreement_logs(
+        iter_service_agreement_logs(w3, shard_start, shard_end))
+
+    if len(processed_events) == 0:
+        return shard_start, shard_end, None, lifecycle_events
+
+    df = create_dataframe.fn(processed_events, SUBSCAN_KEY, MAX_WORKERS, ENRICHMENT_SOURCE,
+                             onfinality_rpc_url(ONFINALITY_KEY), header_cache_path=None)
+    if isinstance(df, dict):
+        return shard_start, shard_end, {name: frame.to_arrow() for name, frame in df.items()}, lifecycle_events
+    return shard_start, shard_end, df.to_arrow(), lifecycle_events
+
+
+@task(log_prints=True, retries=3, retry_delay_seconds=5, tags=['backfill'])
+def backfill_shards(con, start_block, end_block, shard_size, processes, ONFINALITY_KEY, SUBSCAN_KEY, MAX_WORKERS,
+                    ENRICHMENT_SOURCE):
+
+    create_dead_letter_table(con)
+
+    create_service_agreement_event_tables(con)
+
+    con.execute("""
+            CREATE TABLE IF NOT EXISTS backfill_checkpoints 
+            (SHARD_START INTEGER PRIMARY KEY, 
+            SHARD_END INTEGER, 
+            ROWS_LOADED INTEGER, 
+            COMPLETED_AT TIMESTAMP)
+        """)
+
+    completed = dict(con.execute("SELECT SHARD_START, SHARD_END FROM backfill_checkpoints").fetchall())
+
+    # A shard is done once a checkpoint covers it up to its planned end
+    shards = [(shard_start, shard_end)
+              for shard_start, shard_end in plan_backfill_shards(start_block, end_block, shard_size)
+              if completed.get(shard_start, -1) < shard_end]
 
-    df_length = df.height
-    print(f"Inserted {df_length} rows.")
+    print(f"Backfilling blocks {start_block}-{end_block}: {len(shards)} shards left to process.")
+
+    failed_shards = []
+    # Spawned rather than forked: a fork after Polars has used its thread pool (the landing zone's
+    # partition_by, or an earlier attempt of this task) deadlocks in the worker
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = {
+            executor.submit(backfill_shard, shard_start, shard_end, ONFINALITY_KEY, SUBSCAN_KEY, MAX_WORKERS,
+                            ENRICHMENT_SOURCE, processes): (shard_start, shard_end)
+            for shard_start, shard_end in shards
+        }
+
+        for future in as_completed(futures):
+            try:
+                shard_start, shard_end, df, lifecycle_events = future.result()
+            except Exception as error:
+                print(f"Shard {futures[future]} failed: {error}")
+                failed_shards.append(futures[future])
+                continue
+
+            rows_loaded = 0
+            landing_files = []
+
+            # The rows and the checkpoint are committed together, so a crash never skips a shard
+            con.begin()
+            try:
+                if df is not None:
+                    rows_loaded, _, landing_files = insert_batch(con, df, landing=('backfill', shard_start))
+                insert_lifecycle_events(con, lifecycle_events)
+                con.execute(
+                    "INSERT OR REPLACE INTO backfill_checkpoints VALUES (?, ?, ?, ?)",
+                    [shard_start, shard_end, rows_loaded, datetime.datetime.utcnow()]
+                )
+                con.commit()
+            except Exception:
+                con.rollback()
+                remove_landing_files(landing_files)
+                raise
+            compact_landing_files(landing_files)
+
+            print(f"Shard {shard_start}-{shard_end} done: {rows_loaded} rows.")
+
+    if failed_shards:
+        raise RuntimeError(f"{len(failed_shards)} shards failed and will be resumed on retry.")
+
+
+def iter_new_heads_ws(ws_url):
+    # eth_subscribe to newHeads. Heads rather than logs drive the tail, so the cursor also moves past blocks
+    # without events and confirmation depth still applies.
+    from websockets.sync.client import connect
+
+    with connect(ws_url, open_timeout=10) as websocket:
+        websocket.send(json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'eth_subscribe', 'params': ['newHeads']}))
+        response = json.loads(websocket.recv(timeout=10))
+        if 'error' in response:
+            raise ValueError(response['error'])
+        print(f"Subscribed to new heads over websocket ({response['result']}).")
+
+        while True:
+            message = json.loads(websocket.recv(timeout=120))
+            yield int(message['params']['result']['number'], 16)
+
+
+def iter_new_heads_polling(w3, poll_seconds, duration=None):
+    last_head = None
+    started = time.monotonic()
+    while duration is None or time.monotonic() - started < duration:
+        head = w3.eth.block_number
+        if head != last_head:
+            last_head = head
+            yield head
+        time.sleep(poll_seconds)
+
+
+def iter_new_heads(ws_url, w3, poll_seconds=STREAM_POLL_SECONDS):
+    # Websocket subscription first; while it is down, poll the head and try the websocket again later
+    while True:
+        try:
+            yield from iter_new_heads_ws(ws_url)
+        except Exception as error:
+            print(f"Websocket head subscription unavailable ({error}), polling every {poll_seconds} s.")
+        yield from iter_new_heads_polling(w3, poll_seconds, duration=STREAM_WS_RETRY_SECONDS)
+
+
+def process_new_blocks(con, w3, rpc_url, head, block_headers, SUBSCAN_KEY, MAX_WORKERS, ENRICHMENT_SOURCE,
+                       confirmation_depth, run_id=None):
+    # The stream created the tables before its first head; per head only the cursor and the reorg check remain
+    from_block, latest_block = plan_extract_range(con, rpc_url, SERVICE_AGREEMENT_STREAM, head, confirmation_depth,
+                                                  block_headers, create_tables=False)
+    if from_block > latest_block:
+        return
+
+    processed_events, cursor = extract_block_range(con, w3, rpc_url, SERVICE_AGREEMENT_STREAM, from_block,
+                                                   latest_block, run_id=run_id)
+
+    if len(processed_events) > 0:
+        df = create_dataframe.fn(processed_events, SUBSCAN_KEY, MAX_WORKERS, ENRICHMENT_SOURCE, rpc_url,
+                                 block_headers=block_headers)
+        load_to_motherduck.fn(df, con, cursor)
+
+
+def source_rpc_url(source):
+    api_key = os.getenv(source['api_key_env']) if source.get('api_key_env') else None
+    return f"{source['rpc_url']}?apikey={api_key}" if api_key else source['rpc_url']
+
+
+async def ingest_source(con, client, source, SUBSCAN_KEY, ENRICHMENT_SOURCE, confirmation_depth, database_lock):
+    # One source end to end on its own DuckDB cursor, switched to the source's schema. The aiohttp session
+    # and the RPC endpoint pools are shared with every other source of the run. The database steps run in a
+    # thread, one source at a time (database_lock), so the sources' network I/O keeps overlapping.
+    rpc_url = source_rpc_url(source)
+
+    source_con = con.cursor()
+    try:
+        source_con.execute(f"CREATE SCHEMA IF NOT EXISTS {source['schema']}")
+        source_con.execute(f"USE {source['schema']}")
+        print(f"Ingesting {source['stream']} on {source['network']}.")
+
+        event_list, cursor = await extract_new_events_async(
+            source_con, client, rpc_url, confirmation_depth, source['stream'], source['contract_address'],
+            source['topics'], source['header_cache_path'], database_lock, source['event_name'])
+        if len(event_list) > 0:
+            df = await enrich_events_async(event_list, client, SUBSCAN_KEY,
+                                           source.get('enrichment_source', ENRICHMENT_SOURCE), rpc_url,
+                                           source['header_cache_path'])
+            async with database_lock:
+                await asyncio.to_thread(load_to_motherduck.fn, df, source_con, cursor)
+    finally:
+        source_con.close()
 
 
 @flow(name="OriginTrail Pipeline", task_runner=ConcurrentTaskRunner)
@@ -208,7 +2724,9 @@ def ot_flow():
     SUBSCAN_KEY = os.getenv("SUBSCAN_KEY")
     ONFINALITY_KEY = os.getenv("ONFINALITY_KEY")
     MOTHERDUCK_TOKEN = os.getenv("MOTHERDUCK_TOKEN")
-    MAX_WORKERS = 2  # adjust this based on your system's capabilities
+    MAX_WORKERS = 2  # starting Subscan concurrency, adapted at runtime
+    ENRICHMENT_SOURCE = os.getenv("ENRICHMENT_SOURCE", "rpc")  # "rpc" or "subscan"
+    CONFIRMATIONS = int(os.getenv("CONFIRMATION_DEPTH", CONFIRMATION_DEPTH))
 
     serviceAgreementABI = [
   {
@@ -959,9 +3477,12 @@ def ot_flow():
 
     with duckdb.connect(f'md:origintrail?motherduck_token={MOTHERDUCK_TOKEN}&saas_mode=true') as con:
     #with duckdb.connect(database='data/duckDB.db') as con:
-        event_list = extract_events(con, serviceAgreementABI, ONFINALITY_KEY)
-        df = create_dataframe(event_list, SUBSCAN_KEY, MAX_WORKERS)
-        load_to_motherduck(df, con)
+        event_list, cursor = extract_events(con, serviceAgreementABI, ONFINALITY_KEY,
+                                            confirmation_depth=CONFIRMATIONS)
+        if len(event_list) > 0:
+            df = create_dataframe(event_list, SUBSCAN_KEY, MAX_WORKERS, ENRICHMENT_SOURCE,
+                                  onfinality_rpc_url(ONFINALITY_KEY), checkpoint_dir=cursor.get('checkpoint'))
+            load_to_motherduck(df, con, cursor)
 
     # con.register('df', df)
     # con.execute("""
@@ -973,8 +3494,193 @@ def ot_flow():
 
 
 
+@flow(name="OriginTrail Backfill")
+def ot_backfill_flow(start_block=None, end_block=None, shard_size=BACKFILL_SHARD_SIZE, processes=BACKFILL_PROCESSES):
+
+    load_dotenv()
+    SUBSCAN_KEY = os.getenv("SUBSCAN_KEY")
+    ONFINALITY_KEY = os.getenv("ONFINALITY_KEY")
+    MOTHERDUCK_TOKEN = os.getenv("MOTHERDUCK_TOKEN")
+    MAX_WORKERS = 2  # starting Subscan concurrency per backfill process
+    ENRICHMENT_SOURCE = os.getenv("ENRICHMENT_SOURCE", "rpc")  # "rpc" or "subscan"
+    CONFIRMATIONS = int(os.getenv("CONFIRMATION_DEPTH", CONFIRMATION_DEPTH))
+
+    w3 = Web3(PooledRpcProvider(onfinality_rpc_url(ONFINALITY_KEY)))
+
+    if end_block is None:
+        end_block = w3.eth.block_number - CONFIRMATIONS
+
+    if start_block is None:
+        deploy_block = os.getenv("SERVICE_AGREEMENT_V1_DEPLOY_BLOCK")
+        start_block = int(deploy_block) if deploy_block else find_deploy_block(w3, CONTRACT_ADDRESS, end_block)
+        print(f"ServiceAgreementV1 deployment block: {start_block}")
+
+    with duckdb.connect(f'md:origintrail?motherduck_token={MOTHERDUCK_TOKEN}&saas_mode=true') as con:
+    #with duckdb.connect(database='data/duckDB.db') as con:
+        create_publishes_table(con)
+        backfill_shards(con, start_block, end_block, shard_size, processes, ONFINALITY_KEY, SUBSCAN_KEY, MAX_WORKERS,
+                        ENRICHMENT_SOURCE)
+
+
+@flow(name="OriginTrail Pipeline (async)")
+async def ot_async_flow():
+
+    load_dotenv()
+    SUBSCAN_KEY = os.getenv("SUBSCAN_KEY")
+    ONFINALITY_KEY = os.getenv("ONFINALITY_KEY")
+    MOTHERDUCK_TOKEN = os.getenv("MOTHERDUCK_TOKEN")
+    ENRICHMENT_SOURCE = os.getenv("ENRICHMENT_SOURCE", "rpc")  # "rpc" or "subscan"
+    CONFIRMATIONS = int(os.getenv("CONFIRMATION_DEPTH", CONFIRMATION_DEPTH))
+
+    with duckdb.connect(f'md:origintrail?motherduck_token={MOTHERDUCK_TOKEN}&saas_mode=true') as con:
+    #with duckdb.connect(database='data/duckDB.db') as con:
+        event_list, cursor = await extract_events_async(con, ONFINALITY_KEY, confirmation_depth=CONFIRMATIONS)
+        if len(event_list) > 0:
+            df = await create_dataframe_async(event_list, SUBSCAN_KEY, ENRICHMENT_SOURCE,
+                                              onfinality_rpc_url(ONFINALITY_KEY))
+            load_to_motherduck(df, con, cursor)
+
+
+@flow(name="OriginTrail Pipeline (all sources)")
+async def ot_sources_flow(sources=None):
+
+    load_dotenv()
+    SUBSCAN_KEY = os.getenv("SUBSCAN_KEY")
+    MOTHERDUCK_TOKEN = os.getenv("MOTHERDUCK_TOKEN")
+    ENRICHMENT_SOURCE = os.getenv("ENRICHMENT_SOURCE", "rpc")  # "rpc" or "subscan"
+    CONFIRMATIONS = int(os.getenv("CONFIRMATION_DEPTH", CONFIRMATION_DEPTH))
+
+    sources = SOURCES if sources is None else sources
+
+    with duckdb.connect(f'md:origintrail?motherduck_token={MOTHERDUCK_TOKEN}&saas_mode=true') as con:
+    #with duckdb.connect(database='data/duckDB.db') as con:
+        database_lock = asyncio.Lock()
+        async with AsyncHttpClient() as client:
+            results = await asyncio.gather(
+                *(ingest_source(con, client, source, SUBSCAN_KEY, ENRICHMENT_SOURCE, CONFIRMATIONS, database_lock)
+                  for source in sources),
+                return_exceptions=True
+            )
+
+    # A failing source leaves its cursor where it was and does not hold back the others
+    failed_sources = []
+    for source, result in zip(sources, results):
+        if isinstance(result, Exception):
+            print(f"Source {source['stream']} failed: {result}")
+            failed_sources.append(source['stream'])
+    if failed_sources:
+        raise RuntimeError(f"{len(failed_sources)} of {len(sources)} sources failed: {', '.join(failed_sources)}")
+
+
+@flow(name="OriginTrail Dead Letters")
+def ot_dead_letter_flow(sources=None):
+
+    load_dotenv()
+    SUBSCAN_KEY = os.getenv("SUBSCAN_KEY")
+    MOTHERDUCK_TOKEN = os.getenv("MOTHERDUCK_TOKEN")
+    MAX_WORKERS = 2  # starting Subscan concurrency, adapted at runtime
+    ENRICHMENT_SOURCE = os.getenv("ENRICHMENT_SOURCE", "rpc")  # "rpc" or "subscan"
+
+    sources = SOURCES if sources is None else sources
+
+    # Dead letters are kept per schema, drained once per network with that network's node
+    networks = {source['schema']: source for source in sources}
+
+    with duckdb.connect(f'md:origintrail?motherduck_token={MOTHERDUCK_TOKEN}&saas_mode=true') as con:
+    #with duckdb.connect(database='data/duckDB.db') as con:
+        for schema, source in networks.items():
+            con.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+            con.execute(f"USE {schema}")
+            drain_dead_letters(con, SUBSCAN_KEY, MAX_WORKERS, source.get('enrichment_source', ENRICHMENT_SOURCE),
+                               source_rpc_url(source), source['header_cache_path'])
+
+
+@flow(name="OriginTrail Landing Resync")
+def ot_landing_resync_flow(start_day=None, end_day=None):
+    # Reloads publishes from the landing zone, e.g. after a MotherDuck outage or into a fresh database
+
+    load_dotenv()
+    MOTHERDUCK_TOKEN = os.getenv("MOTHERDUCK_TOKEN")
+
+    # Without saas_mode, which would block reading the local landing files
+    with duckdb.connect(f'md:origintrail?motherduck_token={MOTHERDUCK_TOKEN}') as con:
+    #with duckdb.connect(database='data/duckDB.db') as con:
+        create_publishes_table(con)
+        create_dead_letter_table(con)
+        rows = resync_from_landing(con, start_day, end_day)
+        print(f"Merged {rows} landing rows between {start_day or 'the start'} and {end_day or 'the end'}.")
+
+
+@flow(name="OriginTrail publishes Migration")
+def ot_migrate_flow(target='v2', sources=None):
+    # Copies every network's publishes into the target layout; set PUBLISHES_SCHEMA to it once this has run
+
+    load_dotenv()
+    MOTHERDUCK_TOKEN = os.getenv("MOTHERDUCK_TOKEN")
+
+    sources = SOURCES if sources is None else sources
+
+    with duckdb.connect(f'md:origintrail?motherduck_token={MOTHERDUCK_TOKEN}&saas_mode=true') as con:
+    #with duckdb.connect(database='data/duckDB.db') as con:
+        for schema in dict.fromkeys(source['schema'] for source in sources):
+            con.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+            con.execute(f"USE {schema}")
+            create_publishes_table(con, 'v1')
+            copied = migrate_publishes(con, target)
+            print(f"Copied {copied} publishes rows to {schema}.{publishes_table(target)}.")
+
+
+def ot_stream():
+    # Long-running tail: the web3 provider, MotherDuck connection and header cache stay open and every new
+    # head is ingested as soon as it arrives, instead of a scheduled ot_flow rescanning the tail
+    load_dotenv()
+    SUBSCAN_KEY = os.getenv("SUBSCAN_KEY")
+    ONFINALITY_KEY = os.getenv("ONFINALITY_KEY")
+    MOTHERDUCK_TOKEN = os.getenv("MOTHERDUCK_TOKEN")
+    MAX_WORKERS = 2  # starting Subscan concurrency, adapted at runtime
+    ENRICHMENT_SOURCE = os.getenv("ENRICHMENT_SOURCE", "rpc")  # "rpc" or "subscan"
+    CONFIRMATIONS = int(os.getenv("STREAM_CONFIRMATION_DEPTH", STREAM_CONFIRMATION_DEPTH))
+
+    rpc_url = onfinality_rpc_url(ONFINALITY_KEY)
+    w3 = Web3(PooledRpcProvider(rpc_url))
+
+    # Not a Prefect flow run, so the daemon names its own run: one id for every head it ingests
+    run_id = str(uuid.uuid4())
+    print(f"Stream run {run_id}.")
+
+    with duckdb.connect(f'md:origintrail?motherduck_token={MOTHERDUCK_TOKEN}&saas_mode=true') as con, \
+            BlockHeaderCache(rpc_url) as block_headers:
+    #with duckdb.connect(database='data/duckDB.db') as con, BlockHeaderCache(rpc_url) as block_headers:
+        create_pipeline_tables(con)
+
+        for head in iter_new_heads(f'{ONFINALITY_WS_URL}?apikey={ONFINALITY_KEY}', w3):
+            started = time.perf_counter()
+            try:
+                process_new_blocks(con, w3, rpc_url, head, block_headers, SUBSCAN_KEY, MAX_WORKERS,
+                                   ENRICHMENT_SOURCE, CONFIRMATIONS, run_id)
+            except Exception as error:
+                # The cursor did not move, the next head picks the range up again
+                print(f"Head {head} failed: {error}")
+                continue
+            print(f"Head {head} processed in {time.perf_counter() - started:.2f} s.")
+
 
 if __name__ == "__main__":
-    ot_flow()
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        ot_backfill_flow()
+    elif len(sys.argv) > 1 and sys.argv[1] == "stream":
+        ot_stream()
+    elif len(sys.argv) > 1 and sys.argv[1] == "async":
+        asyncio.run(ot_async_flow())
+    elif len(sys.argv) > 1 and sys.argv[1] == "sources":
+        asyncio.run(ot_sources_flow())
+    elif len(sys.argv) > 1 and sys.argv[1] == "drain":
+        ot_dead_letter_flow()
+    elif len(sys.argv) > 1 and sys.argv[1] == "resync":
+        ot_landing_resync_flow(*sys.argv[2:4])
+    elif len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        ot_migrate_flow(*sys.argv[2:3])
+    else:
+        ot_flow()
 
 
@@ -0,0 +1,158 @@
+# Load strategy benchmark: merges batches of synthetic publishes rows into a publishes table that already holds
+# rows, with each LOAD_STRATEGY of OT_Publishes_prefect.merge_publishes. Part of each batch is already loaded,
+# as when a retried range or an overlapping backfill shard comes in again.
+#
+#   python benchmarks/benchmark_load.py --sizes 10000 100000 1000000 --rounds 3 --schemas v1 v2
+#
+# Runs against a fresh local DuckDB file per round by default. With --database the tables are dropped and
+# recreated in that database instead, e.g. --database "md:bench?motherduck_token=..." for MotherDuck.
+# Results go to benchmarks/results/ as JSON named after the commit, to compare versions.
+
+# Standard library imports
+import argparse
+import datetime
+import json
+import os
+import platform
+import tempfile
+import time
+
+import duckdb
+import polars as pl
+
+from benchmark_pipeline import RESULTS_DIR, code_version, percentile
+
+from OT_Publishes_prefect import (  # noqa: E402
+    LOAD_STRATEGIES,
+    ROLLUP_GRANULARITIES,
+    PUBLISHES_COLUMNS,
+    PUBLISHES_SCHEMA,
+    PUBLISHES_TABLES,
+    create_dead_letter_table,
+    create_publishes_table,
+    merge_publishes,
+    publishes_table,
+)
+
+
+def publishes_rows(first, count):
+    # Rows first..first+count-1; the row number decides the hash, so overlapping ranges collide on purpose
+    numbers = list(range(first, first + count))
+    times = [datetime.datetime(2023, 1, 1) + datetime.timedelta(seconds=number) for number in numbers]
+    return pl.DataFrame({
+        "MESSAGE": ["Success"] * count,
+        "ASSET_ID": [str(number) for number in numbers],
+        "BLOCK_NUMBER": [number // 20 for number in numbers],
+        "TIME_ASSET_CREATED": times,
+        "TIME_OF_TRANSACTION": times,
+        "TRAC_PRICE": [number % 1000 / 7 for number in numbers],
+        "EPOCHS_NUMBER": [number % 12 + 1 for number in numbers],
+        "EPOCH_LENGTH-(DAYS)": [90.0] * count,
+        "PUBLISHER_ADDRESS": [f'0x{number % 5000:040x}' for number in numbers],
+        "SENT_ADDRESS": ['0xb20f6f3b9176d4b284ba26b80833ff5bfe6db28f'] * count,
+        "TRANSACTION_HASH": [f'0x{number:064x}' for number in numbers],
+        "BLOCK_HASH": [f'0x{number // 20:064x}' for number in numbers],
+        "ASSET_CONTRACT": ['0x5cac41237127f94c2d21dae0b14bfefa99880630'] * count
+    }).select(PUBLISHES_COLUMNS)
+
+
+def run_round(database, strategy, existing, batch, primary_key, schema):
+    table = publishes_table(schema)
+    with duckdb.connect(database) as con:
+        con.register('existing', existing)
+        con.execute(f"DROP TABLE IF EXISTS {table}")
+        for suffix, _ in ROLLUP_GRANULARITIES:
+            con.execute(f"DROP TABLE IF EXISTS {table}_{suffix}")
+        con.execute("DROP TABLE IF EXISTS enrichment_dead_letters")
+        create_publishes_table(con, schema)
+        if not primary_key:
+            # Same columns without the index, to see what maintaining the primary key costs
+            con.execute(f"CREATE TABLE unindexed AS SELECT * FROM {table} LIMIT 0")
+            con.execute(f"DROP TABLE {table}")
+            con.execute(f"ALTER TABLE unindexed RENAME TO {table}")
+        create_dead_letter_table(con)
+        merge_publishes(con, 'existing', 'anti_join', schema=schema)
+        con.unregister('existing')
+        con.execute("CHECKPOINT")
+
+        # Timed like load_to_motherduck: register the batch and merge it in one transaction
+        started = time.perf_counter()
+        con.begin()
+        con.register('batch', batch)
+        merge_publishes(con, 'batch', strategy, schema=schema)
+        con.unregister('batch')
+        con.commit()
+        elapsed = time.perf_counter() - started
+
+        rows = con.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+    return elapsed, rows
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='publishes load strategy benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000], help='rows per batch')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--strategies', nargs='+', choices=LOAD_STRATEGIES, default=list(LOAD_STRATEGIES))
+    parser.add_argument('--schemas', nargs='+', choices=list(PUBLISHES_TABLES), default=[PUBLISHES_SCHEMA],
+                        help='publishes table layouts to load into')
+    parser.add_argument('--existing', type=float, default=1.0, help='rows already loaded, as a multiple of the size')
+    parser.add_argument('--overlap', type=float, default=0.1, help='share of each batch that is already loaded')
+    parser.add_argument('--without-primary-key', action='store_true',
+                        help='create publishes without its primary key (anti_join only)')
+    parser.add_argument('--database', help='database to benchmark in, defaults to a fresh local file per round')
+    parser.add_argument('--output', help='results file, defaults to benchmarks/results/load-<commit>.json')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    settings = parse_arguments()
+    version = code_version()
+    primary_key = not settings.without_primary_key
+    if not primary_key and 'on_conflict' in settings.strategies:
+        raise SystemExit("on_conflict needs the primary key, run --without-primary-key with --strategies anti_join")
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in settings.sizes:
+            existing_rows = int(size * settings.existing)
+            existing = publishes_rows(0, existing_rows)
+            batch = publishes_rows(existing_rows - int(size * settings.overlap), size)
+
+            for schema in settings.schemas:
+                for strategy in settings.strategies:
+                    timings = []
+                    for round_number in range(settings.rounds):
+                        database = settings.database or os.path.join(
+                            directory, f'{schema}_{strategy}_{size}_{round_number}.db')
+                        elapsed, rows = run_round(database, strategy, existing, batch, primary_key, schema)
+                        timings.append(elapsed)
+
+                    summary = {
+                        'size': size,
+                        'schema': schema,
+                        'strategy': strategy,
+                        'existing_rows': existing_rows,
+                        'overlap': settings.overlap,
+                        'primary_key': primary_key,
+                        'rows_after': rows,
+                        'rounds': len(timings),
+                        'rows_per_second': size / percentile(timings, 0.5),
+                        'seconds': {'p50': percentile(timings, 0.5), 'p99': percentile(timings, 0.99)}
+                    }
+                    results.append(summary)
+                    print(f"{size:>9} rows {schema} {strategy:>11}: {summary['rows_per_second']:>11.0f} rows/s, "
+                          f"p50 {summary['seconds']['p50']:.3f} s p99 {summary['seconds']['p99']:.3f} s")
+
+    output = settings.output or os.path.join(RESULTS_DIR, f'load-{version}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump({
+            'code_version': version,
+            'recorded_at': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'duckdb': duckdb.__version__,
+            'settings': vars(settings),
+            'results': results
+        }, file, indent=2)
+    print(f"Results written to {output}")
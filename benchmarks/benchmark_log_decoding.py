@@ -0,0 +1,89 @@
+# Compares the web3 event-processing path with the raw eth_getLogs decoder used by extract_events.
+# Runs offline on synthetic ServiceAgreementV1Created logs encoded with the contract ABI.
+#
+#   python benchmarks/benchmark_log_decoding.py [number_of_logs]
+
+# Standard library imports
+import os
+import random
+import sys
+import time
+
+# Third-party imports
+from eth_abi import encode
+from web3 import Web3
+from web3._utils.method_formatters import log_entry_formatter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from OT_Publishes_prefect import (  # noqa: E402
+    CONTRACT_ADDRESS,
+    SERVICE_AGREEMENT_V1_CREATED_TOPIC,
+    decode_service_agreement_created,
+    load_service_agreement_abi,
+    process_service_agreement_events,
+)
+
+NUMBER_OF_LOGS = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+ROUNDS = 5
+
+
+def synthetic_logs(count, seed=42):
+    rng = random.Random(seed)
+    asset_contracts = ['0x' + rng.randbytes(20).hex() for _ in range(3)]
+    logs = []
+    for i in range(count):
+        block_number = 3_000_000 + i // 4
+        data = encode(
+            ['bytes', 'uint8', 'uint256', 'uint16', 'uint128', 'uint96'],
+            [rng.randbytes(52), 1, 1_690_000_000 + i, rng.randint(1, 12), 7_776_000, rng.randint(1, 10 ** 22)]
+        )
+        logs.append({
+            'address': CONTRACT_ADDRESS.lower(),
+            'topics': [
+                SERVICE_AGREEMENT_V1_CREATED_TOPIC,
+                '0x' + '00' * 12 + rng.choice(asset_contracts)[2:],
+                '0x' + rng.randint(1, 10 ** 9).to_bytes(32, 'big').hex()
+            ],
+            'data': '0x' + data.hex(),
+            'blockNumber': hex(block_number),
+            'blockHash': '0x' + rng.randbytes(32).hex(),
+            'transactionHash': '0x' + rng.randbytes(32).hex(),
+            'transactionIndex': hex(i % 4),
+            'logIndex': hex(i % 4),
+            'removed': False
+        })
+    return logs
+
+
+def web3_path(event, logs):
+    # What get_logs does per log after the RPC call: result formatting, ABI decoding, then the dict
+    return process_service_agreement_events(event.process_log(log_entry_formatter(log)) for log in logs)
+
+
+def best_of(function, *args):
+    timings = []
+    for _ in range(ROUNDS):
+        start_time = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start_time)
+    return min(timings), result
+
+
+if __name__ == "__main__":
+    w3 = Web3()
+    contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=load_service_agreement_abi())
+    event = contract.events.ServiceAgreementV1Created()
+
+    logs = synthetic_logs(NUMBER_OF_LOGS)
+
+    web3_seconds, web3_events = best_of(web3_path, event, logs)
+    raw_seconds, raw_events = best_of(decode_service_agreement_created, logs)
+
+    # Both paths return typed frames; compared through Arrow, since Polars cannot compare the decimal column
+    assert web3_events.to_arrow().equals(raw_events.to_arrow()), "decoders disagree"
+
+    print(f"Decoded {NUMBER_OF_LOGS} logs (best of {ROUNDS} rounds)")
+    print(f"web3 event processing: {web3_seconds:.3f} s, {web3_seconds / NUMBER_OF_LOGS * 1e6:.1f} us/event")
+    print(f"raw topic/data decode: {raw_seconds:.3f} s, {raw_seconds / NUMBER_OF_LOGS * 1e6:.1f} us/event")
+    print(f"Speedup: {web3_seconds / raw_seconds:.1f}x")
@@ -0,0 +1,241 @@
+# End-to-end throughput benchmark for extract_block_range -> create_dataframe -> load_to_motherduck, loading
+# into a local DuckDB file. Inputs come from benchmarks/chain_simulator.py (started here as a subprocess), or
+# from any node with --rpc-url and --from-block to replay a recorded stretch of the real chain.
+#
+#   python benchmarks/benchmark_pipeline.py --sizes 10000 100000 1000000 --rounds 3
+#
+# Each size runs in a fresh process so peak RSS is per size. Results go to benchmarks/results/ as JSON named
+# after the commit, to compare versions.
+
+# Standard library imports
+import argparse
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(BENCHMARKS_DIR)
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+SIMULATOR = os.path.join(BENCHMARKS_DIR, 'chain_simulator.py')
+SIMULATOR_START_BLOCK = 1_000
+STAGES = ['extract', 'transform', 'load']
+
+sys.path.insert(0, REPOSITORY_DIR)
+
+
+def percentile(values, fraction):
+    # Nearest rank, so small round counts still report an observed value
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def code_version():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPOSITORY_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPOSITORY_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if dirty else commit
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_simulator(settings, head):
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, SIMULATOR,
+        '--port', str(port),
+        '--head', str(head),
+        '--events-per-block', str(settings.events_per_block),
+        '--lifecycle-ratio', str(settings.lifecycle_ratio),
+        '--latency-ms', str(settings.latency_ms),
+        '--error-rate', str(settings.error_rate)
+    ], stdout=subprocess.DEVNULL)
+
+    rpc_url = f'http://127.0.0.1:{port}/rpc'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            requests.post(rpc_url, json={'jsonrpc': '2.0', 'id': 1, 'method': 'eth_blockNumber', 'params': []},
+                          timeout=1)
+            return process, rpc_url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+
+    process.kill()
+    raise RuntimeError("Chain simulator did not start within 60 s.")
+
+
+def run_size(rpc_url, from_block, to_block, rounds, enrichment_source, subscan_url, transform_mode, queue):
+    # Runs in a fresh process: every round loads into a new DuckDB file, so ON CONFLICT never skips work
+    if subscan_url:
+        os.environ['SUBSCAN_TRANSACTION_URL'] = subscan_url
+    os.environ['TRANSFORM_MODE'] = transform_mode
+    # No landing zone: the simulated rows stay out of data/landing and the load stage times the database only
+    os.environ['LANDING_DIR'] = ''
+
+    import duckdb
+    from web3 import Web3
+
+    from OT_Publishes_prefect import (
+        SERVICE_AGREEMENT_STREAM,
+        PooledRpcProvider,
+        create_dataframe,
+        create_dead_letter_table,
+        create_ingestion_state_table,
+        create_publishes_table,
+        create_recent_blocks_table,
+        create_service_agreement_event_tables,
+        extract_block_range,
+        load_to_motherduck,
+        publishes_table,
+    )
+
+    baseline_rss = peak_rss_mb()
+    w3 = Web3(PooledRpcProvider(rpc_url))
+    timings = {stage: [] for stage in STAGES}
+    events = rows = 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        for round_number in range(rounds):
+            with duckdb.connect(os.path.join(directory, f'round_{round_number}.db')) as con:
+                create_publishes_table(con)
+                create_dead_letter_table(con)
+                create_service_agreement_event_tables(con)
+                create_ingestion_state_table(con)
+                create_recent_blocks_table(con)
+
+                started = time.perf_counter()
+                processed_events, cursor = extract_block_range(con, w3, rpc_url, SERVICE_AGREEMENT_STREAM,
+                                                               from_block, to_block)
+                extracted = time.perf_counter()
+                df = create_dataframe.fn(processed_events, None, 8, enrichment_source, rpc_url,
+                                         header_cache_path=None)
+                transformed = time.perf_counter()
+                load_to_motherduck.fn(df, con, cursor)
+                loaded = time.perf_counter()
+                rows = con.execute(f"SELECT count(*) FROM {publishes_table()}").fetchone()[0]
+
+            timings['extract'].append(extracted - started)
+            timings['transform'].append(transformed - extracted)
+            timings['load'].append(loaded - transformed)
+            lifecycle_events = cursor['lifecycle_events'] or {}
+            events = len(processed_events) + sum(len(table_events) for table_events in lifecycle_events.values())
+
+    queue.put({'timings': timings, 'events': events, 'rows': rows, 'baseline_rss_mb': baseline_rss,
+               'peak_rss_mb': peak_rss_mb()})
+
+
+def summarize(size, from_block, to_block, result):
+    timings = result['timings']
+    totals = [sum(stage_timings) for stage_timings in zip(*timings.values())]
+    return {
+        'size': size,
+        'from_block': from_block,
+        'to_block': to_block,
+        'events': result['events'],
+        'rows_loaded': result['rows'],
+        'rounds': len(totals),
+        'events_per_second': result['events'] / percentile(totals, 0.5),
+        'total_seconds': {'p50': percentile(totals, 0.5), 'p99': percentile(totals, 0.99)},
+        'stages': {stage: {'p50': percentile(stage_timings, 0.5), 'p99': percentile(stage_timings, 0.99)}
+                   for stage, stage_timings in timings.items()},
+        'baseline_rss_mb': result['baseline_rss_mb'],
+        'peak_rss_mb': result['peak_rss_mb']
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='End-to-end pipeline throughput benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000],
+                        help='events per run (simulator) or blocks per run (--rpc-url)')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--enrichment-source', choices=['rpc', 'subscan'], default='rpc')
+    parser.add_argument('--transform', choices=['polars', 'sql'], default='polars',
+                        help='TRANSFORM_MODE; with sql the transform is timed as part of load')
+    parser.add_argument('--events-per-block', type=float, default=20)
+    parser.add_argument('--lifecycle-ratio', type=float, default=0)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--rpc-url', help='benchmark against this node instead of the simulator')
+    parser.add_argument('--from-block', type=int, help='first block of the recorded range, with --rpc-url')
+    parser.add_argument('--output', help='results file, defaults to benchmarks/results/pipeline-<commit>.json')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    settings = parse_arguments()
+    version = code_version()
+
+    simulator = None
+    subscan_url = None
+    if settings.rpc_url:
+        if settings.from_block is None:
+            raise SystemExit("--from-block is required with --rpc-url")
+        rpc_url = settings.rpc_url
+        ranges = [(size, settings.from_block, settings.from_block + size - 1) for size in settings.sizes]
+    else:
+        blocks = [math.ceil(size / settings.events_per_block) for size in settings.sizes]
+        simulator, rpc_url = start_simulator(settings, SIMULATOR_START_BLOCK + max(blocks))
+        subscan_url = rpc_url.replace('/rpc', '/api/scan/evm/transaction')
+        ranges = [(size, SIMULATOR_START_BLOCK, SIMULATOR_START_BLOCK + size_blocks - 1)
+                  for size, size_blocks in zip(settings.sizes, blocks)]
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    try:
+        for size, from_block, to_block in ranges:
+            queue = context.Queue()
+            process = context.Process(target=run_size, args=(rpc_url, from_block, to_block, settings.rounds,
+                                                             settings.enrichment_source, subscan_url,
+                                                             settings.transform, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+
+            summary = summarize(size, from_block, to_block, result)
+            results.append(summary)
+            print(f"{size:>9} events: {summary['events_per_second']:>9.0f} events/s, "
+                  + ", ".join(f"{stage} p50 {summary['stages'][stage]['p50']:.2f} s "
+                              f"p99 {summary['stages'][stage]['p99']:.2f} s" for stage in STAGES)
+                  + f", peak RSS {summary['peak_rss_mb']:.0f} MB")
+    finally:
+        if simulator is not None:
+            simulator.terminate()
+
+    output = settings.output or os.path.join(RESULTS_DIR, f'pipeline-{version}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump({
+            'code_version': version,
+            'recorded_at': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'input': 'rpc' if settings.rpc_url else 'simulator',
+            'settings': vars(settings),
+            'results': results
+        }, file, indent=2)
+    print(f"Results written to {output}")
@@ -0,0 +1,184 @@
+# Storage benchmark for the publishes table layouts (PUBLISHES_SCHEMA v1, v2 and v3): loads the same synthetic
+# rows into each and reports the database file size, a full scan, the dashboards' per-publisher aggregate (from
+# the table and from its hourly rollup) and lookups by transaction hash.
+#
+#   python benchmarks/benchmark_storage.py --rows 1000000 --rounds 5
+#
+# Hashes and addresses are random like the real ones, so string compression gets no help from zero padding.
+# Results go to benchmarks/results/ as JSON named after the commit, to compare versions.
+
+# Standard library imports
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+
+import duckdb
+import polars as pl
+
+from benchmark_pipeline import RESULTS_DIR, code_version, percentile
+
+from OT_Publishes_prefect import (  # noqa: E402
+    PUBLISHES_COLUMNS,
+    PUBLISHES_TABLES,
+    create_dead_letter_table,
+    create_publishes_table,
+    merge_publishes,
+    publishes_table,
+)
+
+# Every column the dashboards aggregate over, so the scan reads the whole table
+SCAN_QUERY = """
+    SELECT count(*), count(DISTINCT ASSET_ID), max(BLOCK_NUMBER), min(TIME_OF_TRANSACTION), sum(TRAC_PRICE),
+        avg(EPOCHS_NUMBER), count(DISTINCT {publisher}), count(DISTINCT {recipient}),
+        count(DISTINCT TRANSACTION_HASH), count(DISTINCT BLOCK_HASH)
+    FROM {table}
+"""
+
+# The Grafana panels: publishes and average TRAC per publisher per hour. The groups are counted in DuckDB, so
+# the timing is the aggregation rather than fetching every group into Python.
+GROUP_QUERY = """
+    SELECT count(*) FROM (
+        SELECT time_bucket(INTERVAL 1 HOUR, TIME_OF_TRANSACTION) AS time, {publisher}, count(*), avg(TRAC_PRICE)
+        FROM {table}
+        GROUP BY ALL)
+"""
+
+# The same panels read from the rollup merge_publishes maintains; the outer aggregates read every column
+ROLLUP_QUERY = """
+    SELECT count(*), max(time), max({publisher}), sum(PUBLISHES), sum(TRAC_AVG) FROM (
+        SELECT BUCKET AS time, {publisher}, PUBLISHES, TRAC_AVG
+        FROM {table}_per_hour)
+"""
+
+# Publisher and recipient columns per table; v3 groups on its integer keys
+ADDRESS_COLUMNS = {
+    'publishes_v3': {'publisher': 'PUBLISHER_KEY', 'recipient': 'RECIPIENT_KEY'}
+}
+
+
+def random_hex(rng, length):
+    return '0x' + rng.randbytes(length).hex()
+
+
+def publishes_rows(count, seed):
+    rng = random.Random(seed)
+    publishers = [random_hex(rng, 20) for _ in range(max(1, count // 200))]
+    blocks = [random_hex(rng, 32) for _ in range(count // 20 + 1)]
+    times = [datetime.datetime(2023, 1, 1) + datetime.timedelta(seconds=12 * (number // 20))
+             for number in range(count)]
+    return pl.DataFrame({
+        "MESSAGE": ["Success"] * count,
+        "ASSET_ID": [str(number) for number in range(count)],
+        "BLOCK_NUMBER": [3_000_000 + number // 20 for number in range(count)],
+        "TIME_ASSET_CREATED": times,
+        "TIME_OF_TRANSACTION": times,
+        "TRAC_PRICE": [rng.randint(10 ** 15, 10 ** 20) / 1e18 for _ in range(count)],
+        "EPOCHS_NUMBER": [rng.randint(1, 12) for _ in range(count)],
+        "EPOCH_LENGTH-(DAYS)": [90.0] * count,
+        "PUBLISHER_ADDRESS": [rng.choice(publishers) for _ in range(count)],
+        "SENT_ADDRESS": ['0xb20f6f3b9176d4b284ba26b80833ff5bfe6db28f'] * count,
+        "TRANSACTION_HASH": [random_hex(rng, 32) for _ in range(count)],
+        "BLOCK_HASH": [blocks[number // 20] for number in range(count)],
+        "ASSET_CONTRACT": ['0x5cac41237127f94c2d21dae0b14bfefa99880630'] * count
+    }).select(PUBLISHES_COLUMNS)
+
+
+def measure(database, schema, rows, probes, rounds):
+    table = publishes_table(schema)
+    with duckdb.connect(database) as con:
+        create_publishes_table(con, schema)
+        create_dead_letter_table(con)
+        con.register('batch', rows)
+        merge_publishes(con, 'batch', 'anti_join', schema=schema)
+        con.unregister('batch')
+        con.execute("CHECKPOINT")
+        size_bytes = os.path.getsize(database)
+
+        columns = ADDRESS_COLUMNS.get(table, {'publisher': 'PUBLISHER_ADDRESS', 'recipient': 'SENT_ADDRESS'})
+        scans = []
+        groups = []
+        rollups = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            con.execute(SCAN_QUERY.format(table=table, **columns)).fetchall()
+            scans.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            con.execute(GROUP_QUERY.format(table=table, **columns)).fetchall()
+            groups.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            con.execute(ROLLUP_QUERY.format(table=table, **columns)).fetchall()
+            rollups.append(time.perf_counter() - started)
+
+        # One statement per hash; v2 and v3 are queried with the bytes. DuckDB plans it as a filtered scan, not a
+        # primary-key probe, and per-statement overhead dominates, so the figure is noisy from run to run
+        if table != 'publishes':
+            probes = [bytes.fromhex(transaction_hash[2:]) for transaction_hash in probes]
+        statement = f"SELECT BLOCK_NUMBER FROM {table} WHERE TRANSACTION_HASH = ?"
+        lookups = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for transaction_hash in probes:
+                con.execute(statement, [transaction_hash]).fetchone()
+            lookups.append((time.perf_counter() - started) / len(probes))
+
+    return {
+        'schema': schema,
+        'table': table,
+        'rows': rows.height,
+        'size_mb': size_bytes / 1024 ** 2,
+        'scan_seconds': {'p50': percentile(scans, 0.5), 'p99': percentile(scans, 0.99)},
+        'group_seconds': {'p50': percentile(groups, 0.5), 'p99': percentile(groups, 0.99)},
+        'rollup_seconds': {'p50': percentile(rollups, 0.5), 'p99': percentile(rollups, 0.99)},
+        'lookup_microseconds': {'p50': percentile(lookups, 0.5) * 1e6, 'p99': percentile(lookups, 0.99) * 1e6}
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='publishes storage layout benchmark')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--lookups', type=int, default=1_000, help='primary-key lookups per round')
+    parser.add_argument('--schemas', nargs='+', choices=list(PUBLISHES_TABLES), default=list(PUBLISHES_TABLES))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='results file, defaults to benchmarks/results/storage-<commit>.json')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    settings = parse_arguments()
+    version = code_version()
+
+    rows = publishes_rows(settings.rows, settings.seed)
+    probes = random.Random(settings.seed).sample(rows['TRANSACTION_HASH'].to_list(), settings.lookups)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for schema in settings.schemas:
+            summary = measure(os.path.join(directory, f'{schema}.db'), schema, rows, probes, settings.rounds)
+            results.append(summary)
+            print(f"{schema} ({summary['table']}): {summary['size_mb']:.1f} MB, "
+                  f"scan p50 {summary['scan_seconds']['p50']:.3f} s, "
+                  f"per-publisher hours p50 {summary['group_seconds']['p50']:.3f} s "
+                  f"(rollup {summary['rollup_seconds']['p50'] * 1000:.1f} ms), "
+                  f"lookup p50 {summary['lookup_microseconds']['p50']:.0f} us")
+
+    output = settings.output or os.path.join(RESULTS_DIR, f'storage-{version}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump({
+            'code_version': version,
+            'recorded_at': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'duckdb': duckdb.__version__,
+            'settings': vars(settings),
+            'results': results
+        }, file, indent=2)
+    print(f"Results written to {output}")
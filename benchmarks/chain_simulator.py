@@ -0,0 +1,293 @@
+# Local stand-in for OnFinality and Subscan, for load testing the pipeline without spending API quota.
+# Serves a deterministic synthetic chain over the JSON-RPC subset the pipeline uses (eth_blockNumber,
+# eth_getLogs, eth_getBlockByNumber, eth_getTransactionByHash, eth_getCode, eth_chainId, batches included)
+# and Subscan's evm/transaction endpoint, with configurable event density, latency, errors and rate limits.
+#
+#   python benchmarks/chain_simulator.py --head 1000000 --events-per-block 1 --latency-ms 40 --error-rate 0.01
+#
+# Then point the pipeline at it:
+#
+#   ONFINALITY_RPC_URL=http://127.0.0.1:8545/rpc \
+#   SUBSCAN_TRANSACTION_URL=http://127.0.0.1:8545/api/scan/evm/transaction \
+#   python OT_Publishes_prefect.py
+
+# Standard library imports
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from OT_Publishes_prefect import (  # noqa: E402
+    CONTRACT_ADDRESS,
+    SERVICE_AGREEMENT_LIFECYCLE_EVENTS,
+    SERVICE_AGREEMENT_V1_CREATED_TOPIC,
+)
+
+GENESIS_TIMESTAMP = 1_680_000_000
+BLOCK_TIME_SECONDS = 12
+CHAIN_ID = '0x7e5'
+ASSET_CONTRACT = '0x5cac41237127f94c2d21dae0b14bfefa99880630'
+# Same message the real node sends, so the pipeline's chunker treats it as a range error
+TOO_MANY_RESULTS = 'query returned more than {} results'
+
+
+def word(value):
+    return value.to_bytes(32, 'big').hex()
+
+
+class SyntheticChain:
+    # Everything is derived from (seed, block number, log index), so any range can be served in any order
+    # and repeated queries return the same logs.
+
+    def __init__(self, head, events_per_block, lifecycle_ratio, deploy_block, block_time, seed):
+        self.started = time.monotonic()
+        self.initial_head = head
+        self.events_per_block = events_per_block
+        self.lifecycle_ratio = lifecycle_ratio
+        self.deploy_block = deploy_block
+        self.block_time = block_time
+        self.seed = seed
+
+    def head(self):
+        # With a block time set the head keeps moving, for streaming tests
+        if not self.block_time:
+            return self.initial_head
+        return self.initial_head + int((time.monotonic() - self.started) / self.block_time)
+
+    def digest(self, *parts):
+        return '0x' + hashlib.sha256(repr((self.seed,) + parts).encode()).hexdigest()
+
+    def block_hash(self, number):
+        return self.digest('block', number)
+
+    def header(self, number):
+        return {
+            'number': hex(number),
+            'hash': self.block_hash(number),
+            'parentHash': self.block_hash(number - 1),
+            'timestamp': hex(GENESIS_TIMESTAMP + number * BLOCK_TIME_SECONDS),
+            'transactions': []
+        }
+
+    def events_in_block(self, number):
+        if number < self.deploy_block:
+            return 0
+        whole = int(self.events_per_block)
+        fraction = self.events_per_block - whole
+        if fraction and random.Random(self.seed * 1_000_003 + number).random() < fraction:
+            whole += 1
+        return whole
+
+    def log(self, number, index, topics_filter):
+        transaction_hash = self.digest('tx', number, index)
+        rng = random.Random(transaction_hash)
+        lifecycle = rng.random() < self.lifecycle_ratio
+        topic = rng.choice(list(SERVICE_AGREEMENT_LIFECYCLE_EVENTS)) if lifecycle else SERVICE_AGREEMENT_V1_CREATED_TOPIC
+        if topics_filter is not None and topic not in topics_filter:
+            return None
+
+        if lifecycle:
+            value_name = SERVICE_AGREEMENT_LIFECYCLE_EVENTS[topic][2]
+            topics = [topic, self.digest('agreement', rng.randint(0, 10 ** 6))]
+            data = word(rng.randint(1, 12) if value_name == 'epochsNumber' else rng.randint(1, 10 ** 22)) \
+                if value_name is not None else ''
+        else:
+            keyword = rng.randbytes(52)
+            topics = [topic, '0x' + '00' * 12 + ASSET_CONTRACT[2:], '0x' + word(rng.randint(1, 10 ** 9))]
+            data = (word(192) + word(1) + word(GENESIS_TIMESTAMP + number * BLOCK_TIME_SECONDS)
+                    + word(rng.randint(1, 12)) + word(7_776_000) + word(rng.randint(1, 10 ** 22))
+                    + word(len(keyword)) + (keyword + b'\0' * 12).hex())
+
+        return {
+            'address': CONTRACT_ADDRESS.lower(),
+            'topics': topics,
+            'data': '0x' + data,
+            'blockNumber': hex(number),
+            'blockHash': self.block_hash(number),
+            'transactionHash': transaction_hash,
+            'transactionIndex': hex(index),
+            'logIndex': hex(index),
+            'removed': False
+        }
+
+    def logs(self, from_block, to_block, topics_filter, max_results):
+        logs = []
+        for number in range(max(from_block, self.deploy_block), min(to_block, self.head()) + 1):
+            for index in range(self.events_in_block(number)):
+                log = self.log(number, index, topics_filter)
+                if log is not None:
+                    logs.append(log)
+                    if max_results and len(logs) > max_results:
+                        raise ValueError(TOO_MANY_RESULTS.format(max_results))
+        return logs
+
+    def transaction(self, transaction_hash):
+        return {
+            'hash': transaction_hash,
+            'from': '0x' + hashlib.sha256(('from' + transaction_hash).encode()).hexdigest()[:40],
+            'to': CONTRACT_ADDRESS.lower()
+        }
+
+
+class TokenBucket:
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        if not self.rate:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    chain = None
+    settings = None
+    rpc_bucket = None
+    subscan_bucket = None
+    stats = None
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def rpc_call(self, call):
+        method = call.get('method')
+        params = call.get('params', [])
+        try:
+            if method == 'eth_blockNumber':
+                result = hex(self.chain.head())
+            elif method == 'eth_chainId':
+                result = CHAIN_ID
+            elif method == 'eth_getLogs':
+                query = params[0]
+                topics = query.get('topics') or [None]
+                topics_filter = topics[0] if isinstance(topics[0], list) else [topics[0]] if topics[0] else None
+                result = self.chain.logs(int(query['fromBlock'], 16), int(query['toBlock'], 16), topics_filter,
+                                         self.settings.max_logs)
+            elif method == 'eth_getBlockByNumber':
+                number = int(params[0], 16)
+                result = self.chain.header(number) if number <= self.chain.head() else None
+            elif method == 'eth_getTransactionByHash':
+                result = self.chain.transaction(params[0])
+            elif method == 'eth_getCode':
+                result = '0x6080' if int(params[1], 16) >= self.chain.deploy_block else '0x'
+            else:
+                return {'jsonrpc': '2.0', 'id': call.get('id'),
+                        'error': {'code': -32601, 'message': f'Method {method} not supported by the simulator'}}
+        except ValueError as error:
+            return {'jsonrpc': '2.0', 'id': call.get('id'), 'error': {'code': -32005, 'message': str(error)}}
+        return {'jsonrpc': '2.0', 'id': call.get('id'), 'result': result}
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        subscan = self.path.startswith('/api/scan')
+        self.stats['subscan' if subscan else 'rpc'] += 1
+
+        time.sleep(self.settings.latency_ms / 1000 * random.lognormvariate(0, self.settings.latency_sigma))
+
+        if random.random() < self.settings.error_rate:
+            self.stats['errors'] += 1
+            self.send_json(503, {'error': 'simulated failure'})
+            return
+
+        if subscan:
+            if not self.subscan_bucket.take():
+                self.stats['rate_limited'] += 1
+                self.send_json(429, {'code': 20008, 'message': 'API rate limit exceeded'})
+                return
+            self.send_json(200, {'code': 0, 'message': 'Success', 'generated_at': int(time.time()),
+                                 'data': {**self.chain.transaction(body['hash']),
+                                          'to': {'address': CONTRACT_ADDRESS.lower()}}})
+            return
+
+        if not self.rpc_bucket.take():
+            self.stats['rate_limited'] += 1
+            self.send_json(429, {'jsonrpc': '2.0', 'id': None,
+                                 'error': {'code': -32029, 'message': 'rate limit exceeded'}})
+            return
+
+        if isinstance(body, list):
+            self.send_json(200, [self.rpc_call(call) for call in body])
+        else:
+            self.send_json(200, self.rpc_call(body))
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Synthetic OriginTrail chain and Subscan server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8545)
+    parser.add_argument('--head', type=int, default=1_000_000, help='latest block number')
+    parser.add_argument('--deploy-block', type=int, default=0, help='first block with contract events')
+    parser.add_argument('--block-time', type=float, default=0, help='seconds per new block, 0 for a fixed head')
+    parser.add_argument('--events-per-block', type=float, default=1.0, help='mean events per block, e.g. 0.2 or 20')
+    parser.add_argument('--lifecycle-ratio', type=float, default=0.2,
+                        help='share of events that are Extended/RewardRaised/Terminated/UpdateRewardRaised')
+    parser.add_argument('--latency-ms', type=float, default=0, help='median response latency')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='lognormal spread of the latency')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of requests answered with HTTP 503')
+    parser.add_argument('--rpc-rate-limit', type=float, default=0, help='JSON-RPC requests per second, 0 = none')
+    parser.add_argument('--subscan-rate-limit', type=float, default=0, help='Subscan requests per second, 0 = none')
+    parser.add_argument('--max-logs', type=int, default=10_000, help='eth_getLogs result cap, 0 = none')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def start_simulator(settings):
+    # Serves in a background thread and returns the server; handy for benchmarks that start their own
+    chain = SyntheticChain(settings.head, settings.events_per_block, settings.lifecycle_ratio,
+                           settings.deploy_block, settings.block_time, settings.seed)
+
+    handler = type('Handler', (SimulatorHandler,), {
+        'chain': chain,
+        'settings': settings,
+        'rpc_bucket': TokenBucket(settings.rpc_rate_limit),
+        'subscan_bucket': TokenBucket(settings.subscan_rate_limit),
+        'stats': {'rpc': 0, 'subscan': 0, 'errors': 0, 'rate_limited': 0}
+    })
+
+    server = ThreadingHTTPServer((settings.host, settings.port), handler)
+    server.daemon_threads = True
+    server.stats = handler.stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    settings = parse_arguments()
+    server = start_simulator(settings)
+    address = f'http://{settings.host}:{server.server_address[1]}'
+    print(f"Simulating {settings.events_per_block} events/block up to block {settings.head} on {address}")
+    print(f"  ONFINALITY_RPC_URL={address}/rpc")
+    print(f"  SUBSCAN_TRANSACTION_URL={address}/api/scan/evm/transaction")
+
+    try:
+        while True:
+            time.sleep(10)
+            print(f"Requests: {server.stats}")
+    except KeyboardInterrupt:
+        server.shutdown()